@@ -4,7 +4,7 @@ from operator import itemgetter
 from collections import defaultdict, OrderedDict as ordereddict
 
 from .tags import Tag, TAG_DoABC
-from .io import DummyABCStream, ABCStream, uint
+from .io import DummyABCStream, ABCStream, ABCReader, uint
 
 nothing = object()
 
@@ -26,13 +26,92 @@ class ABCStruct(object):
             return '{0}(...)'.format(self.__class__.__name__)
         else:
             with p.group(4, self.__class__.__name__ + '(', ')'):
-                for (idx, (k, v)) in enumerate(self.__dict__.items()):
+                items = ((k, v) for (k, v) in self.__dict__.items()
+                    if not k.startswith('_')) # skip private caches
+                for (idx, (k, v)) in enumerate(items):
                     if idx:
                         p.text(',')
                         p.breakable()
                     p.text(k + '=')
                     p.pretty(v)
 
+class LazyList(object):
+    """
+    Sequence of structures that are decoded from the stream only when accessed.
+    Offsets of items are found when list is created, using ``skip`` function,
+    which must read single item without decoding it. ``read`` function is
+    called with stream positioned at the item and the item number.
+    """
+
+    def __init__(self, stream, count, read, skip):
+        self._stream = stream
+        self._read = read
+        self._offsets = []
+        for i in range(count):
+            self._offsets.append(stream.tell())
+            skip(stream)
+        self._items = [nothing]*count
+
+    def peek(self, index, fun):
+        """Calls ``fun`` with stream positioned at start of item ``index``,
+        without decoding and caching the item"""
+        if index < 0:
+            index += len(self)
+        pos = self._stream.tell()
+        try:
+            self._stream.seek(self._offsets[index])
+            return fun(self._stream)
+        finally:
+            self._stream.seek(pos)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        val = self._items[index]
+        if val is nothing:
+            val = self._items[index] = self._decode(index)
+        return val
+
+    def _decode(self, index):
+        return self.peek(index, lambda stream: self._read(stream, index))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def index(self, value):
+        for (idx, item) in enumerate(self):
+            if item is value or item == value:
+                return idx
+        raise ValueError("{0!r} is not in list".format(value))
+
+    def __repr__(self):
+        return '<{0} {1}/{2} decoded>'.format(self.__class__.__name__,
+            sum(1 for i in self._items if i is not nothing), len(self))
+
+class StringList(LazyList):
+    """
+    Strings of the constant pool. Only offsets of strings are found when list
+    is created, each string is decoded from the shared buffer on first access
+    """
+
+    def __init__(self, data, bounds):
+        self._data = data
+        self._bounds = bounds
+        self._items = [nothing]*(len(bounds) >> 1)
+
+    def _decode(self, index):
+        return str(self._data[self._bounds[index*2]:self._bounds[index*2+1]],
+            'utf-8')
+
+    def __pretty__(self, p, cycle):
+        p.pretty(list(self))
+
 class CPoolInfo(ABCStruct):
 
     def __init__(self):
@@ -48,15 +127,11 @@ class CPoolInfo(ABCStruct):
     def read(cls, stream):
         self = cls()
         index = Index(self)
-        int_count = stream.read_u30()
-        self.integer = [stream.read_s32() for i in range(int_count-1)]
-        uint_count = stream.read_u30()
-        self.uinteger = [stream.read_u32() for i in range(uint_count-1)]
-        double_count = stream.read_u30()
-        self.double = [stream.read_d64() for i in range(double_count-1)]
-        string_count = stream.read_u30()
-        self.string = [stream.read(stream.read_u30()).decode('utf-8')
-            for i in range(string_count-1)]
+        self.integer = stream.read_s32_array(max(stream.read_u30()-1, 0))
+        self.uinteger = stream.read_u32_array(max(stream.read_u30()-1, 0))
+        self.double = stream.read_d64_array(max(stream.read_u30()-1, 0))
+        self.string = StringList(stream.buffer,
+            stream.read_string_bounds(max(stream.read_u30()-1, 0)))
         namespace_count = stream.read_u30()
         self.namespace_info = [NamespaceInfo.read(stream, index)
             for i in range(namespace_count-1)]
@@ -229,6 +304,20 @@ class MethodInfo(ABCStruct):
                 for i in range(param_count)]
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        param_count = stream.read_u30()
+        for i in range(param_count + 2): # return type, params, name
+            stream.read_u30()
+        flags = stream.read_u8()
+        if flags & cls.HAS_OPTIONAL:
+            for i in range(stream.read_u30()):
+                stream.read_u30()
+                stream.read_u8()
+        if flags & cls.HAS_PARAM_NAMES:
+            for i in range(param_count):
+                stream.read_u30()
+
     def write(self, stream, index):
         stream.write_u30(len(self.param_type))
         stream.write_u30(index.get_multiname_index(self.return_type))
@@ -380,6 +469,30 @@ class TraitsInfo(ABCStruct):
                 for i in range(metadata_count)]
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        stream.read_u30()
+        byte = stream.read_u8()
+        kind = byte & 15
+        if kind in (0, 6):
+            stream.read_u30()
+            stream.read_u30()
+            if stream.read_u30():
+                stream.read_u8()
+        elif kind in (1, 2, 3, 4, 5):
+            stream.read_u30()
+            stream.read_u30()
+        else:
+            raise NotImplementedError(kind)
+        if (byte >> 4) & cls.ATTR_Metadata:
+            for i in range(stream.read_u30()):
+                stream.read_u30()
+
+    @classmethod
+    def skip_list(cls, stream):
+        for i in range(stream.read_u30()):
+            cls.skip(stream)
+
     def write(self, stream, index):
         stream.write_u30(index.get_multiname_index(self.name))
         if hasattr(self, 'metadata'):
@@ -442,6 +555,11 @@ class ScriptInfo(ABCStruct):
             for i in range(trait_count)]
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        stream.read_u30()
+        TraitsInfo.skip_list(stream)
+
     def write(self, stream, index):
         stream.write_u30(index.get_method_index(self.init))
         stream.write_u30(len(self.traits_info))
@@ -463,6 +581,12 @@ class MetadataInfo(ABCStruct):
             for i in range(item_count))
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        stream.read_u30()
+        for i in range(stream.read_u30()*2):
+            stream.read_u30()
+
     def write(self, stream, index):
         stream.write_u30(index.get_string_index(self.name))
         stream.write_u30(len(self.item_info))
@@ -471,10 +595,18 @@ class MetadataInfo(ABCStruct):
             stream.write_u30(index.get_string_index(v))
 
 class MethodBodyInfo(ABCStruct):
+    """
+    Method body. For body read from file only raw ``code`` is stored, list
+    of instructions ``bytecode`` is decoded on first access and is
+    assembled again when file is written. Bodies which were never decoded
+    are written as is (constant pool of the file is kept for them)
+    """
+    _index = None # index of the file the body was read from
 
     @classmethod
     def read(cls, stream, index):
         self = cls()
+        self._index = index
         self.method = index.get_method(stream.read_u30())
         self.max_stack = stream.read_u30()
         self.local_count = stream.read_u30()
@@ -488,13 +620,47 @@ class MethodBodyInfo(ABCStruct):
         trait_count = stream.read_u30()
         self.traits_info = [TraitsInfo.read(stream, index)
             for i in range(trait_count)]
-        # We do not read bytecodes by default any more
-        # This is for performance reasons
-        # And since there are more bytecodes that we really know
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        for i in range(5):
+            stream.read_u30()
+        stream.seek(stream.read_u30(), 1) # code
+        for i in range(stream.read_u30()*5): # exceptions
+            stream.read_u30()
+        TraitsInfo.skip_list(stream)
+
+    @property
+    def bytecode(self):
+        try:
+            return self._bytecode
+        except AttributeError:
+            self.read_bytecodes()
+            return self._bytecode
+
+    @bytecode.setter
+    def bytecode(self, value):
+        self._bytecode = value
+        self.__dict__.pop('_instructions', None)
+
+    @property
+    def decoded(self):
+        """Whether ``bytecode`` was accessed or set, i.e. ``code`` is stale"""
+        return '_bytecode' in self.__dict__
+
+    def instructions(self):
+        """Returns list of ``(offset, bytecode)`` pairs parsed from ``code``,
+        result is cached until the code is changed"""
+        try:
+            return self._instructions
+        except AttributeError:
+            with self._index.for_method(self) as mindex:
+                self._instructions = bytecode.parse(self.code, mindex)
+            return self._instructions
+
     def read_bytecodes(self):
-        with index.for_method(self) as mindex:
+        with self._index.for_method(self) as mindex:
             bcode = bytecode.parse(self.code, mindex)
         ext_labels = defaultdict(list)
         for exc in self.exception_info:
@@ -504,24 +670,33 @@ class MethodBodyInfo(ABCStruct):
             bytecode.make_labels(bcode, ext_labels)))
 
     def write(self, stream, index):
-        with index.for_method(self) as mindex:
-            bcode, self.code = bytecode.assemble(self.bytecode, mindex)
-        if not isinstance(stream, DummyABCStream):
-            lindex = dict((label, index)
+        offsets = None
+        if not self.decoded:
+            pass # constants of the code are kept in the pool
+        elif isinstance(stream, DummyABCStream):
+            # collecting constants, no need to assemble code
+            with index.for_method(self) as mindex:
+                bytecode.collect(self.bytecode, mindex)
+        else:
+            with index.for_method(self) as mindex:
+                bcode, self.code = bytecode.assemble(self.bytecode, mindex)
+            self.__dict__.pop('_instructions', None)
+            offsets = dict((label, index)
                 for (index, label) in bcode
                 if isinstance(label, bytecode.Label))
-            for exc in self.exception_info:
-                exc.get_labels(lindex)
         stream.write_u30(index.get_method_index(self.method))
         stream.write_u30(self.max_stack)
         stream.write_u30(self.local_count)
         stream.write_u30(self.init_scope_depth)
         stream.write_u30(self.max_scope_depth)
-        stream.write_u30(len(self.code))
-        stream.write(self.code)
+        if isinstance(stream, DummyABCStream):
+            stream.write_u30(0)
+        else:
+            stream.write_u30(len(self.code))
+            stream.write(self.code)
         stream.write_u30(len(self.exception_info))
         for exc in self.exception_info:
-            exc.write(stream, index)
+            exc.write(stream, index, offsets)
         stream.write_u30(len(self.traits_info))
         for t in self.traits_info:
             t.write(stream, index)
@@ -549,21 +724,23 @@ class ExceptionInfo(ABCStruct):
         self.target = p[1]
         yield p
 
-    def write(self, stream, index):
-        stream.write_u30(self.exc_from)
-        stream.write_u30(self.exc_to)
-        stream.write_u30(self.target)
+    def write(self, stream, index, offsets=None):
+        """Writes exception, if ``offsets`` dictionary is given, labels are
+        replaced by offsets from it"""
+        if offsets is None:
+            stream.write_u30(self.exc_from)
+            stream.write_u30(self.exc_to)
+            stream.write_u30(self.target)
+        else:
+            stream.write_u30(offsets[self.exc_from])
+            stream.write_u30(offsets[self.exc_to])
+            stream.write_u30(offsets[self.target])
         stream.write_u30(index.get_multiname_index(self.exc_type))
         if self.var_name:
             stream.write_u30(index.get_multiname_index(self.var_name))
         else:
             stream.write_u30(0)
 
-    def get_labels(self, alllabels):
-        self.exc_from = alllabels[self.exc_from]
-        self.exc_to = alllabels[self.exc_to]
-        self.target = alllabels[self.target]
-
 CONSTANT_QName       = 0x07
 CONSTANT_QNameA      = 0x0D
 CONSTANT_RTQName     = 0x0F
@@ -742,6 +919,17 @@ class InstanceInfo(ABCStruct):
             for i in range(trait_count)]
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        stream.read_u30()
+        stream.read_u30()
+        if stream.read_u8() & cls.CONSTANT_ClassProtectedNs:
+            stream.read_u30()
+        for i in range(stream.read_u30()):
+            stream.read_u30()
+        stream.read_u30()
+        TraitsInfo.skip_list(stream)
+
     def write(self, stream, index):
         stream.write_u30(index.get_multiname_index(self.name))
         stream.write_u30(index.get_multiname_index(self.super_name))
@@ -775,6 +963,11 @@ class ClassInfo(ABCStruct):
             for i in range(trait_count)]
         return self
 
+    @classmethod
+    def skip(cls, stream):
+        stream.read_u30()
+        TraitsInfo.skip_list(stream)
+
     def write(self, stream, index):
         stream.write_u30(index.get_method_index(self.cinit))
         stream.write_u30(len(self.trait))
@@ -786,13 +979,35 @@ class ClassInfo(ABCStruct):
             self.instance_info.super_name)
 
 class Index(object):
-    def __init__(self, data, method=None):
+    def __init__(self, data, method=None, reverse=None):
         if isinstance(data, CPoolInfo):
             self.cpool = data
         else:
             self.data = data
             self.cpool = data.constant_pool
         self._method = method
+        # reverse dictionaries (value -> position) for lists in constant pool
+        # and file, keyed by id of the list, shared with method indexes
+        self._reverse = {} if reverse is None else reverse
+
+    def _find(self, lst, value):
+        """Same as ``lst.index(value)`` but uses dictionary, which is built
+        once for each list and updated when items are appended to the list"""
+        entry = self._reverse.get(id(lst))
+        if entry is None or entry[0] is not lst:
+            entry = self._reverse[id(lst)] = [lst, 0, {}]
+        rev = entry[2]
+        if entry[1] != len(lst):
+            if entry[1] > len(lst): # items removed, need to rebuild
+                rev.clear()
+                entry[1] = 0
+            for i in range(entry[1], len(lst)):
+                rev.setdefault(lst[i], i)
+            entry[1] = len(lst)
+        try:
+            return rev[value]
+        except KeyError:
+            raise ValueError("{0!r} is not in list".format(value))
 
     def get_string(self, index):
         if index == 0:
@@ -803,7 +1018,7 @@ class Index(object):
         #~ if value == '':
             #~ return 0
         assert isinstance(value, str), "Value {0!r} is not string".format(value)
-        return self.cpool.string.index(value)+1
+        return self._find(self.cpool.string, value)+1
 
     def get_integer(self, index):
         if index == 0:
@@ -811,7 +1026,7 @@ class Index(object):
         return self.cpool.integer[index-1]
 
     def get_integer_index(self, value):
-        return self.cpool.integer.index(value)+1
+        return self._find(self.cpool.integer, value)+1
 
     def get_uinteger(self, index):
         if index == 0:
@@ -819,7 +1034,7 @@ class Index(object):
         return self.cpool.uinteger[index-1]
 
     def get_uinteger_index(self, value):
-        return self.cpool.uinteger.index(value)+1
+        return self._find(self.cpool.uinteger, value)+1
 
     def get_multiname(self, index):
         if index == 0:
@@ -829,7 +1044,7 @@ class Index(object):
     def get_multiname_index(self, multiname):
         if isinstance(multiname, AnyType):
             return 0
-        return self.cpool.multiname_info.index(multiname)+1
+        return self._find(self.cpool.multiname_info, multiname)+1
 
     def get_namespace(self, index):
         if index == 0:
@@ -837,13 +1052,13 @@ class Index(object):
         return self.cpool.namespace_info[index-1]
 
     def get_namespace_index(self, namespace):
-        return self.cpool.namespace_info.index(namespace)+1
+        return self._find(self.cpool.namespace_info, namespace)+1
 
     def get_namespace_set(self, index):
         return self.cpool.ns_set_info[index-1]
 
     def get_namespace_set_index(self, namespace_set):
-        return self.cpool.ns_set_info.index(namespace_set)+1
+        return self._find(self.cpool.ns_set_info, namespace_set)+1
 
     def get_double(self, index):
         if index == 0:
@@ -851,7 +1066,7 @@ class Index(object):
         return self.cpool.double[index-1]
 
     def get_double_index(self, value):
-        return self.cpool.double.index(value) + 1
+        return self._find(self.cpool.double, value) + 1
 
     def get_class(self, index):
         return self.data.class_info[index]
@@ -860,19 +1075,19 @@ class Index(object):
         return self.data.method_info[index]
 
     def get_method_index(self, meth):
-        return self.data.method_info.index(meth)
+        return self._find(self.data.method_info, meth)
 
     def get_class_index(self, cls):
-        return self.data.class_info.index(cls)
+        return self._find(self.data.class_info, cls)
 
     def get_metadata(self, index):
         return self.data.metadata_info[index]
 
     def get_metadata_index(self, value):
-        return self.data.metadata_info.index(value)
+        return self._find(self.data.metadata_info, value)
 
     def for_method(self, method):
-        return Index(getattr(self, 'data', self.cpool), method)
+        return Index(getattr(self, 'data', self.cpool), method, self._reverse)
 
     def get_exception_info(self, index):
         return self._method.exception_info[index]
@@ -933,9 +1148,13 @@ class Index(object):
         del self.cpool
         del self._method
 
+def _negcount(item):
+    return -item[1]
+
 class IndexCreator(object):
     def __init__(self, data):
         self.data = data
+        self._index = Index(data)
         self.strings = defaultdict(int)
         self.integers = defaultdict(int)
         self.uintegers = defaultdict(int)
@@ -945,21 +1164,34 @@ class IndexCreator(object):
         self.namespace_sets = defaultdict(int)
         self.metadata = defaultdict(int)
 
-    def update(self, data):
-        data.constant_pool.integer = list(map(itemgetter(0),
-            sorted(self.integers.items(), key=itemgetter(1))))
-        data.constant_pool.double = list(map(itemgetter(0),
-            sorted(self.doubles.items(), key=itemgetter(1))))
-        data.constant_pool.string = list(map(itemgetter(0),
-            sorted(self.strings.items(), key=itemgetter(1))))
-        data.constant_pool.multiname_info = list(map(itemgetter(0),
-            sorted(self.multinames.items(), key=itemgetter(1))))
-        data.constant_pool.namespace_info = list(map(itemgetter(0),
-            sorted(self.namespaces.items(), key=itemgetter(1))))
-        data.constant_pool.ns_set_info = list(map(itemgetter(0),
-            sorted(self.namespace_sets.items(), key=itemgetter(1))))
-        data.metadata_info = list(map(itemgetter(0),
-            sorted(self.metadata.items(), key=itemgetter(1))))
+    @staticmethod
+    def _by_frequency(counts, original=None):
+        # most used constants go first to get shortest u30 indexes, stable
+        # sort keeps order of the first use for equally used ones
+        res = [k for (k, v) in sorted(counts.items(), key=_negcount)]
+        if original is None:
+            return res
+        # original entries are kept in place, new ones are appended
+        original = list(original)
+        known = set(original)
+        return original + [k for k in res if k not in known]
+
+    def update(self, data, keep_pool=False):
+        """Fills constant pool and metadata of ``data`` with collected
+        values. If ``keep_pool`` is True, entries of current constant pool
+        keep their indexes (used when some code is written undecoded)"""
+        cpool = data.constant_pool
+        def order(name, counts):
+            return self._by_frequency(counts,
+                getattr(cpool, name) if keep_pool else None)
+        cpool.integer = order('integer', self.integers)
+        cpool.uinteger = order('uinteger', self.uintegers)
+        cpool.double = order('double', self.doubles)
+        cpool.string = order('string', self.strings)
+        cpool.multiname_info = order('multiname_info', self.multinames)
+        cpool.namespace_info = order('namespace_info', self.namespaces)
+        cpool.ns_set_info = order('ns_set_info', self.namespace_sets)
+        data.metadata_info = self._by_frequency(self.metadata)
 
     def get_string_index(self, value):
         assert isinstance(value, str), "Value {0!r} is not string".format(value)
@@ -974,37 +1206,38 @@ class IndexCreator(object):
         self.uintegers[value] += 1
         return 0
 
+    def _intern(self, table, value):
+        # constants referenced by value are counted only when it's seen
+        # for the first time, because it's written to the pool only once
+        new = value not in table
+        table[value] += 1
+        if new:
+            value.write(DummyABCStream(), self)
+        return 0
+
     def get_multiname_index(self, value):
         if isinstance(value, AnyType):
             return 0
-        self.multinames[value] += 1
-        value.write(DummyABCStream(), self)
-        return 0
+        return self._intern(self.multinames, value)
 
     def get_namespace_index(self, value):
-        self.namespaces[value] += 1
-        value.write(DummyABCStream(), self)
-        return 0
+        return self._intern(self.namespaces, value)
 
     def get_namespace_set_index(self, value):
-        self.namespace_sets[value] += 1
-        value.write(DummyABCStream(), self)
-        return 0
+        return self._intern(self.namespace_sets, value)
 
     def get_double_index(self, value):
         self.doubles[value] += 1
         return 0
 
     def get_method_index(self, meth):
-        return self.data.method_info.index(meth)
+        return self._index.get_method_index(meth)
 
     def get_class_index(self, cls):
-        return self.data.class_info.index(cls)
+        return self._index.get_class_index(cls)
 
     def get_metadata_index(self, value):
-        self.metadata[value] += 1
-        value.write(DummyABCStream(), self)
-        return 0
+        return self._intern(self.metadata, value)
 
     def for_method(self, method):
         self._method = method
@@ -1056,7 +1289,7 @@ class ABCFile(ABCStruct):
         self.method_body_info = []
 
     @classmethod
-    def read(cls, stream):
+    def read(cls, stream, lazy=False):
         self = cls()
         self.minor_version = stream.read_u16()
         self.major_version = stream.read_u16()
@@ -1064,6 +1297,10 @@ class ABCFile(ABCStruct):
         assert self.major_version == 46
         self.constant_pool = CPoolInfo.read(stream)
         index = Index(self)
+        if lazy:
+            self._read_lazy(stream, index)
+            assert not stream.read(1)
+            return self
         method_count = stream.read_u30()
         self.method_info = [MethodInfo.read(stream, index)
             for i in range(method_count)]
@@ -1084,12 +1321,83 @@ class ABCFile(ABCStruct):
         assert not stream.read(1)
         return self
 
+    def _read_lazy(self, stream, index):
+        self.method_info = LazyList(stream, stream.read_u30(),
+            lambda stream, i: MethodInfo.read(stream, index),
+            MethodInfo.skip)
+        self.metadata_info = LazyList(stream, stream.read_u30(),
+            lambda stream, i: MetadataInfo.read(stream, index),
+            MetadataInfo.skip)
+        class_count = stream.read_u30()
+        self._instance_info = instance_info = LazyList(stream, class_count,
+            lambda stream, i: InstanceInfo.read(stream, index),
+            InstanceInfo.skip)
+        self.class_info = LazyList(stream, class_count,
+            lambda stream, i: ClassInfo.read(stream, index, instance_info[i]),
+            ClassInfo.skip)
+        self.script_info = LazyList(stream, stream.read_u30(),
+            lambda stream, i: ScriptInfo.read(stream, index),
+            ScriptInfo.skip)
+        self.method_body_info = LazyList(stream, stream.read_u30(),
+            lambda stream, i: MethodBodyInfo.read(stream, index),
+            MethodBodyInfo.skip)
+
+    def get_class_names(self):
+        """Returns list of names of all classes. For lazily read file this
+        doesn't decode classes"""
+        if isinstance(self.class_info, LazyList):
+            index = Index(self)
+            return [self._instance_info.peek(i,
+                lambda stream: index.get_multiname(stream.read_u30()))
+                for i in range(len(self._instance_info))]
+        return [cls.instance_info.name for cls in self.class_info]
+
+    def get_script_traits(self, script):
+        """Returns list of (name, kind) pairs for traits of the script number
+        ``script``. For lazily read file this doesn't decode the script"""
+        if isinstance(self.script_info, LazyList):
+            index = Index(self)
+            def traits(stream):
+                stream.read_u30() # init
+                res = []
+                for i in range(stream.read_u30()):
+                    pos = stream.tell()
+                    name = index.get_multiname(stream.read_u30())
+                    res.append((name, stream.read_u8() & 15))
+                    stream.seek(pos)
+                    TraitsInfo.skip(stream)
+                return res
+            return self.script_info.peek(script, traits)
+        return [(t.name, t.kind) for t in self.script_info[script].traits_info]
+
     def write(self, stream):
         index = IndexCreator(self)
         self._write(DummyABCStream(), index)
-        index.update(self)
+        index.update(self, keep_pool=not all(body.decoded
+            for body in self.method_body_info))
         self._write(stream, Index(self))
 
+    def sizes(self):
+        """Returns list of ``(section, entries, bytes)`` for constant pool
+        lists as they are encoded with current order (i.e. after ``write``),
+        followed by total size of constant pool"""
+        index = Index(self)
+        cpool = self.constant_pool
+        res = []
+        for name in ('integer', 'uinteger', 'double', 'string',
+            'namespace_info', 'ns_set_info', 'multiname_info'):
+            part = CPoolInfo()
+            setattr(part, name, getattr(cpool, name))
+            buf = ABCStream()
+            part.write(buf, index)
+            # other six lists are written as single zero byte each
+            res.append((name, len(getattr(cpool, name)),
+                len(buf.getvalue()) - 6))
+        buf = ABCStream()
+        cpool.write(buf, index)
+        res.append(('constant_pool', None, len(buf.getvalue())))
+        return res
+
     def _write(self, stream, index):
         stream.write_u16(self.minor_version)
         stream.write_u16(self.major_version)
@@ -1114,6 +1422,10 @@ class ABCFile(ABCStruct):
 
 class DoABC(Tag):
     code = TAG_DoABC
+    lazy = False # decode only parts of ABC file that are accessed
+    # whether real_body differs from original data, code which changes
+    # real_body of read tag must set it, otherwise original data is written
+    dirty = True
 
     def __init__(self):
         pass
@@ -1122,6 +1434,7 @@ class DoABC(Tag):
         super()._read(stream)
         self.parse_body()
         self._decode()
+        self.dirty = False
 
     def parse_body(self):
         self.flags = struct.unpack('<L', self.data[:4])[0]
@@ -1130,21 +1443,22 @@ class DoABC(Tag):
         self.body = self.data[idx+1:]
 
     def _decode(self):
-        abc = ABCStream(self.body)
-        self.real_body = ABCFile.read(abc)
+        abc = ABCReader(self.body)
+        self.real_body = ABCFile.read(abc, lazy=self.lazy)
 
     def disassemble(self):
         for body in self.real_body.method_body_info:
             print("METHOD", body.method.name, "PARAMS",
                 getattr(body.method, 'param_name', body.method.param_type))
-            index = Index(self.real_body, body)
-            for (off, code) in bytecode.parse(body.code, index):
+            for (off, code) in body.instructions():
                 print('    {0:5d} {1!s}'.format(off, code))
 
     def empty(self):
         self.real_body = ABCFile()
+        self.dirty = True
 
     def clean_metadata(self):
+        self.dirty = True
         self.real_body.metadata_info[:] = []
         for i in self.real_body.method_info:
             if hasattr(i, 'param_name'):
@@ -1165,12 +1479,14 @@ class DoABC(Tag):
                 if hasattr(t, 'metadata'):
                     del t.metadata
 
-    def blob(self):
-        buf = ABCStream()
+    def buffers(self):
         prefix = struct.pack('<L', self.flags)+self.name.encode('utf-8')+b'\x00'
+        if not self.dirty and self.data[:len(prefix)] == prefix:
+            return super().buffers()
+        buf = ABCStream()
         self.real_body.write(buf)
-        self.data = prefix + buf.getvalue()
-        self.length = len(self.data)
-        return super().blob()
+        body = buf.getbuffer()
+        self.length = len(prefix) + len(body)
+        return [self.header(), prefix, body]
 
 from . import bytecode
@@ -0,0 +1,214 @@
+import os
+import os.path
+import zlib
+import struct
+import hashlib
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from . import library, graphics
+
+# version of the compressed bitmap cache, increment when changing encoding
+CACHE_VERSION = 1
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+class Bitmap(object):
+    """
+    Image to be embedded as DefineBitsLossless2 tag and bound to the class
+    ``class_name`` (which must be defined in the code and extend
+    ``flash.display.BitmapData``). ``data`` is either contents of PNG file or
+    raw RGBA pixels, in the latter case ``width`` and ``height`` are required
+    """
+
+    def __init__(self, class_name, data, width=None, height=None):
+        self.class_name = class_name
+        self.data = data
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def load(cls, class_name, filename):
+        with open(filename, 'rb') as f:
+            return cls(class_name, f.read())
+
+    def key(self, level):
+        """Hash of the contents, used as a key for compressed data cache"""
+        h = hashlib.sha1(struct.pack('<LllB', CACHE_VERSION,
+            -1 if self.width is None else self.width,
+            -1 if self.height is None else self.height, level + 1))
+        h.update(self.data)
+        return h.hexdigest()
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+def read_png(data):
+    """Decodes PNG file, returns tuple ``(width, height, rgba)``. Only 8-bit
+    non-interlaced RGB and RGBA images are supported"""
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    pos = 8
+    idat = []
+    header = None
+    while pos < len(data):
+        length, ctype = struct.unpack_from('>L4s', data, pos)
+        chunk = data[pos+8:pos+8+length]
+        pos += length + 12
+        if ctype == b'IHDR':
+            header = struct.unpack('>LLBBBBB', chunk)
+        elif ctype == b'IDAT':
+            idat.append(chunk)
+        elif ctype == b'IEND':
+            break
+    if header is None:
+        raise ValueError("No IHDR chunk in PNG file")
+    width, height, depth, color, _, _, interlace = header
+    if depth != 8 or color not in (2, 6) or interlace:
+        raise ValueError("Unsupported PNG format (depth: {0}, color type: {1}"
+            ", interlace: {2})".format(depth, color, interlace))
+    bpp = 4 if color == 6 else 3
+    stride = width * bpp
+    raw = zlib.decompress(b''.join(idat))
+    prev = bytearray(stride)
+    rows = []
+    for y in range(height):
+        start = y * (stride + 1)
+        ftype = raw[start]
+        row = bytearray(raw[start+1:start+1+stride])
+        if ftype == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i-bpp]) & 0xFF
+        elif ftype == 2:
+            for i in range(stride):
+                row[i] = (row[i] + prev[i]) & 0xFF
+        elif ftype == 3:
+            for i in range(stride):
+                left = row[i-bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            for i in range(stride):
+                if i >= bpp:
+                    row[i] = (row[i] + _paeth(row[i-bpp], prev[i],
+                        prev[i-bpp])) & 0xFF
+                else:
+                    row[i] = (row[i] + prev[i]) & 0xFF
+        elif ftype:
+            raise ValueError("Wrong PNG filter type {0}".format(ftype))
+        rows.append(row)
+        prev = row
+    pixels = b''.join(rows)
+    if bpp == 3:
+        rgba = bytearray(width * height * 4)
+        rgba[0::4] = pixels[0::3]
+        rgba[1::4] = pixels[1::3]
+        rgba[2::4] = pixels[2::3]
+        rgba[3::4] = b'\xff' * (width * height)
+        pixels = rgba
+    return width, height, bytes(pixels)
+
+def rgba_to_argb(rgba):
+    """Converts RGBA pixels to premultiplied ARGB used by DefineBitsLossless2
+    tag"""
+    res = bytearray(len(rgba))
+    alpha = rgba[3::4]
+    res[0::4] = alpha
+    res[1::4] = rgba[0::4]
+    res[2::4] = rgba[1::4]
+    res[3::4] = rgba[2::4]
+    if alpha.count(255) != len(alpha):
+        for i, a in enumerate(alpha):
+            if a != 255:
+                p = i*4
+                res[p+1] = (res[p+1]*a + 127) // 255
+                res[p+2] = (res[p+2]*a + 127) // 255
+                res[p+3] = (res[p+3]*a + 127) // 255
+    return bytes(res)
+
+def encode_bitmap(data, width, height, level):
+    """Returns tuple ``(width, height, compressed_argb)`` for the data of
+    ``Bitmap``. Runs in worker processes"""
+    if width is None:
+        width, height, data = read_png(data)
+    return width, height, zlib.compress(rgba_to_argb(data), level)
+
+def _cache_file(key):
+    return os.path.join(library.cache_dir, key + '.bitmap')
+
+def _load_cached(key):
+    if not library.cache_dir:
+        return None
+    try:
+        with open(_cache_file(key), 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if len(data) < 4:
+        return None
+    width, height = struct.unpack_from('<HH', data)
+    return width, height, data[4:]
+
+def _save_cached(key, value):
+    if not library.cache_dir:
+        return
+    width, height, payload = value
+    try:
+        if not os.path.isdir(library.cache_dir):
+            os.makedirs(library.cache_dir)
+        fd, tmpname = tempfile.mkstemp(dir=library.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack('<HH', width, height))
+                f.write(payload)
+            os.rename(tmpname, _cache_file(key))
+        except:
+            os.unlink(tmpname)
+            raise
+    except (IOError, OSError) as e:
+        warnings.warn("Can't write bitmap cache: {0}".format(e))
+
+def embed_bitmaps(bitmaps, first_id=1, level=9, processes=None):
+    """
+    Makes DefineBitsLossless2 tag for each of ``bitmaps`` with character ids
+    starting from ``first_id``. Bitmaps which are not in the cache (see
+    ``library.cache_dir``) are compressed in parallel by the pool of
+    ``processes`` (default is number of CPUs, 1 compresses in this process)
+    """
+    keys = [b.key(level) for b in bitmaps]
+    results = {}
+    missing = []
+    for bmp, key in zip(bitmaps, keys):
+        if key in results:
+            continue
+        results[key] = _load_cached(key)
+        if results[key] is None:
+            missing.append((key, bmp))
+    if len(missing) > 1 and processes != 1:
+        with ProcessPoolExecutor(processes) as pool:
+            futures = [(key, pool.submit(encode_bitmap, bmp.data, bmp.width,
+                bmp.height, level)) for key, bmp in missing]
+            for key, fut in futures:
+                results[key] = fut.result()
+                _save_cached(key, results[key])
+    else:
+        for key, bmp in missing:
+            results[key] = encode_bitmap(bmp.data, bmp.width, bmp.height,
+                level)
+            _save_cached(key, results[key])
+    res = []
+    for cid, key in enumerate(keys, first_id):
+        width, height, payload = results[key]
+        tag = graphics.DefineBitsLossless2(cid,
+            graphics.DefineBitsLossless.RGB32, width, height)
+        tag.bitmap_data = payload
+        res.append(tag)
+    return res
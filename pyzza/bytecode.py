@@ -2,7 +2,7 @@ from collections import defaultdict
 import sys
 import warnings
 
-from .io import ABCStream
+from .io import ABCStream, ABCReader
 from . import io
 from .abc import (MultinameInfo, MethodInfo, ExceptionInfo,
     ClassInfo, NamespaceInfo, Offset, Register,
@@ -913,7 +913,7 @@ class bytecodes(metaclass=gather_bytecodes):
 class Parser(object):
 
     def __init__(self, str, index):
-        self._stream = ABCStream(str)
+        self._stream = ABCReader(str)
         self._index = index
 
     def parse(self):
@@ -960,6 +960,13 @@ class Assembler(object):
         assert not fwjumps, 'Not found forward jumps {0!r}'.format(fwjumps)
         return codes, self._stream.getvalue()
 
+def collect(codes, index):
+    """Registers all constants referenced by ``codes`` in ``index``"""
+    for code in codes:
+        for (name, typ, idx, format) in code.format:
+            if idx is not None:
+                getattr(index, 'get_{0}_index'.format(idx))(getattr(code, name))
+
 def parse(code, index):
     return list(Parser(code, index).parse())
 
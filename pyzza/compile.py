@@ -3,10 +3,12 @@ from operator import methodcaller, attrgetter, itemgetter
 from collections import defaultdict
 from contextlib import contextmanager
 import copy
+import math
 import sys
 import os.path
 
-from . import parser, library, swf, bytecode, abc, tags
+from . import (parser, library, swf, bytecode, abc, tags, assets, fastbytes,
+    folding, typeinfer, dedup)
 
 class SyntaxError(Exception):
     def __init__(self, message, **kwargs):
@@ -19,6 +21,21 @@ class NotAClassError(SyntaxError): pass
 class VerificationError(Exception): pass
 class StackError(VerificationError): pass
 
+# bytecodes for arithmetic operators, and ones used when operands and result
+# are ints, see ``CodeFragment.arith_bytecode``
+ARITH_BYTECODES = {
+    parser.Add: bytecode.add,
+    parser.Subtract: bytecode.subtract,
+    parser.Multiply: bytecode.multiply,
+    parser.Divide: bytecode.divide,
+    parser.Modulo: bytecode.modulo,
+    }
+INT_BYTECODES = {
+    parser.Add: bytecode.add_i,
+    parser.Subtract: bytecode.subtract_i,
+    parser.Multiply: bytecode.multiply_i,
+    }
+
 def binary(fun):
     def wrapper(self, node, void):
         if void:
@@ -532,22 +549,22 @@ class CodeFragment:
             self.class_name = ast.name
             assert not ast.func_export
             self.namespace = {k: Property(abc.QName(abc.NSPackage(''),k))
-                for k in ast.func_locals}
+                for k in sorted(ast.func_locals)}
         elif mode == 'eval':
             self.bytecodes.append(bytecode.getlocal_0())
             self.bytecodes.append(bytecode.pushwith())
             self.namespace = {k: LocalProperty(abc.QName(abc.NSPackage(''),k))
-                for k in ast.func_locals}
+                for k in sorted(ast.func_locals)}
         else:
-            self.namespace = {k: Register() for k in ast.func_locals
+            self.namespace = {k: Register() for k in sorted(ast.func_locals)
                 if k not in ast.func_export}
-        for k in ast.func_imports:
+        for k in sorted(ast.func_imports):
             self.namespace[k] = Property()
         if ast.func_export:
             if mode == 'global':
                 self.namespace.update((k, Property(
                     abc.QName(abc.NSPrivate(filename), k)))
-                    for (idx, k) in enumerate(ast.func_export))
+                    for (idx, k) in enumerate(sorted(ast.func_export)))
             elif mode in ('method', 'function', 'evalchildfunc'):
                 self.activation = Register()
                 self.bytecodes.append(bytecode.newactivation())
@@ -555,7 +572,7 @@ class CodeFragment:
                 self.bytecodes.append(bytecode.pushscope())
                 self.bytecodes.append(bytecode.setlocal(self.activation))
                 self.namespace.update((k, ClosureSlot(idx+1, k))
-                    for (idx, k) in enumerate(ast.func_export))
+                    for (idx, k) in enumerate(sorted(ast.func_export)))
             elif mode == 'eval':
                 pass
                 # no registers anyway
@@ -592,15 +609,27 @@ class CodeFragment:
                 self.namespace[v] = Register(i)
         if self.classmethod:
             self.namespace[arguments[0]] = ClsRegister(0)
-        for args in ast.func_publicnames:
+        for args in sorted(ast.func_publicnames):
             self.library.add_name(*args)
         body = ast.body if hasattr(ast, 'body') else ast
+        if mode == 'global' and body:
+            # names assigned once to constant are inlined in all functions
+            self.constants = folding.module_constants(body)
+        else:
+            self.constants = {}
+        # types of local variables, used for int arithmetics and coercion
+        self.register_types = typeinfer.infer(body or (),
+            [k for (k, v) in self.namespace.items()
+                if type(v) is Register and v.value is None],
+            self.find_constant, self.is_range_loop)
         if body:
             self.exec_suite(body, eval=mode == 'eval')
         else:
             self.bytecodes[:] = ()
         self.bytecodes.append(bytecode.returnvoid())
         self.fix_registers()
+        self.bytecodes = fastbytes.optimize_code(self.bytecodes,
+            self.exceptions)
         self.verify_stack()
 
     ##### Post-processing #####
@@ -617,8 +646,10 @@ class CodeFragment:
         argnum = len(self.arguments)
         if self.varargument:
             argnum += 1
+        # most used registers get the lowest numbers, so they can be
+        # accessed by short getlocal_N/setlocal_N bytecodes
         for (idx, (name, freq)) in zip(count(argnum),
-            sorted(rcount.items(), key=itemgetter(1))):
+            sorted(rcount.items(), key=itemgetter(1), reverse=True)):
             regs[name] = idx
         self.local_count = argnum + len(regs)
         for bcode in self.bytecodes:
@@ -639,16 +670,21 @@ class CodeFragment:
     def verify_stack(self):
         stack_size = 0
         max_stack_size = 0
+        reachable = True
         for bcode in self.bytecodes:
-            if stack_size < len(bcode.stack_before):
-                raise StackError("Not enought operands in the stack for "
-                    "{0!r} (operands: {1})".format(bcode, bcode.stack_before))
             if isinstance(bcode, bytecode.Label):
                 if hasattr(bcode, '_verify_stack'):
-                    if bcode._verify_stack != stack_size:
+                    if not reachable:
+                        # code after jump, the stack is the one of the jump
+                        stack_size = bcode._verify_stack
+                    elif bcode._verify_stack != stack_size:
                         raise StackError("Unbalanced stack at {0!r}".format(bcode))
                 else:
                     bcode._verify_stack = stack_size
+                reachable = True
+            if stack_size < len(bcode.stack_before):
+                raise StackError("Not enought operands in the stack for "
+                    "{0!r} (operands: {1})".format(bcode, bcode.stack_before))
             old_stack = stack_size
             stack_size += len(bcode.stack_after) - len(bcode.stack_before)
             if isinstance(bcode, bytecode.JumpBytecode):
@@ -657,6 +693,8 @@ class CodeFragment:
                         raise StackError("Unbalanced stack at {0!r}".format(bcode))
                 else:
                     bcode.offset._verify_stack = stack_size
+            if isinstance(bcode, fastbytes.TERMINATORS):
+                reachable = False
             #~ print('[{0:3d} -{1:2d}] {2}'.format(old_stack, stack_size, bcode))
             if stack_size > max_stack_size:
                 max_stack_size = stack_size
@@ -670,6 +708,14 @@ class CodeFragment:
         self.execute(node, False)
 
     def execute(self, node, void=True):
+        if not void and isinstance(node, folding.FOLDABLE):
+            try:
+                value = folding.evaluate(node, self.find_constant)
+            except folding.NotConstant:
+                pass
+            else:
+                self.push_constant(value)
+                return
         oldline = self.current_line
         if self.current_line != node.lineno:
             self.bytecodes.append(bytecode.debugline(node.lineno))
@@ -695,6 +741,87 @@ class CodeFragment:
         for line in suite:
             self.execute(line)
 
+    def find_constant(self, name):
+        for ns in chain((self,), self.parent_namespaces):
+            if name in ns.namespace:
+                try:
+                    return ns.constants[name]
+                except (AttributeError, KeyError):
+                    break
+        raise folding.NotConstant(name)
+
+    def is_range_loop(self, node):
+        if not isinstance(node.expr, parser.Call) \
+            or not isinstance(node.expr.expr, parser.Name):
+            return False
+        name = node.expr.expr.value
+        for ns in chain((self,), self.parent_namespaces):
+            if name in ns.namespace:
+                val = ns.namespace[name]
+                return isinstance(val, Builtin) and val.name == 'range'
+        return False
+
+    def expr_type(self, node):
+        return typeinfer.expr_type(node, self.register_types,
+            self.find_constant)
+
+    def arith_bytecode(self, cls, left, right):
+        """Returns bytecode for binary operator ``cls`` applied to values of
+        types ``left`` and ``right``, int bytecodes are used when result is
+        known to fit in int"""
+        if cls in INT_BYTECODES \
+            and isinstance(left, typeinfer.IntRange) \
+            and isinstance(right, typeinfer.IntRange) \
+            and isinstance(typeinfer.binary_type(cls, left, right),
+                typeinfer.IntRange):
+            return INT_BYTECODES[cls]()
+        return ARITH_BYTECODES[cls]()
+
+    def coerce_bytecode(self, name):
+        """Returns bytecode to convert value before storing to the local
+        variable ``name``"""
+        typ = self.register_types.get(name)
+        if isinstance(typ, typeinfer.IntRange):
+            return bytecode.convert_i()
+        elif typ == typeinfer.NUMBER:
+            return bytecode.convert_d()
+        elif typ == typeinfer.STRING:
+            return bytecode.coerce_s()
+        return bytecode.coerce_a()
+
+    def push_constant(self, value):
+        if isinstance(value, bool):
+            if value:
+                self.bytecodes.append(bytecode.pushtrue())
+            else:
+                self.bytecodes.append(bytecode.pushfalse())
+            return
+        if isinstance(value, str):
+            self.bytecodes.append(bytecode.pushstring(value))
+            return
+        # int constants are signed 32 bit, bigger values are pushed as double
+        if isinstance(value, float) and value.is_integer() \
+            and -(1 << 31) <= value < (1 << 31) \
+            and (value or math.copysign(1.0, value) > 0):
+            value = int(value) # except negative zero
+        if isinstance(value, float):
+            if math.isnan(value):
+                self.bytecodes.append(bytecode.pushnan())
+            else:
+                self.bytecodes.append(bytecode.pushdouble(value))
+        elif 0 <= value < 128:
+            self.bytecodes.append(bytecode.pushbyte(value))
+        elif 0 <= value < 65536:
+            self.bytecodes.append(bytecode.pushshort(value))
+        elif -(1 << 31) <= value < (1 << 31):
+            self.bytecodes.append(bytecode.pushint(value))
+        else:
+            try:
+                value = float(value)
+            except OverflowError: # literal is too big for Number
+                value = float('inf') if value > 0 else float('-inf')
+            self.bytecodes.append(bytecode.pushdouble(value))
+
     def find_name(self, name, node):
         for ns in chain((self,), self.parent_namespaces):
             if name in ns.namespace:
@@ -979,7 +1106,7 @@ class CodeFragment:
             yield
         finally:
             if isinstance(target, parser.Name):
-                self.bytecodes.append(bytecode.coerce_a())
+                self.bytecodes.append(self.coerce_bytecode(target.value))
                 if isinstance(reg, Register):
                     self.bytecodes.append(bytecode.setlocal(reg))
                 elif isinstance(reg, ClosureSlot):
@@ -1039,16 +1166,14 @@ class CodeFragment:
             self.push_value(node.expr)
             if node.operator.value == '=':
                 pass
-            elif node.operator.value == '+=':
-                self.bytecodes.append(bytecode.add())
-            elif node.operator.value == '-=':
-                self.bytecodes.append(bytecode.subtract())
-            elif node.operator.value == '*=':
-                self.bytecodes.append(bytecode.multiply())
-            elif node.operator.value == '/=':
-                self.bytecodes.append(bytecode.divide())
-            elif node.operator.value == '%=':
-                self.bytecodes.append(bytecode.modulo())
+            elif node.operator.value in typeinfer.AUGMENTED:
+                if isinstance(node.target, parser.Name):
+                    typ = self.register_types.get(node.target.value)
+                else:
+                    typ = typeinfer.ANY
+                self.bytecodes.append(self.arith_bytecode(
+                    typeinfer.AUGMENTED[node.operator.value],
+                    typ, self.expr_type(node.expr)))
             else:
                 raise NotImplementedError(node.operator)
 
@@ -1193,17 +1318,7 @@ class CodeFragment:
 
     def visit_number(self, node, void):
         if void: return
-        if isinstance(node.value, float):
-            self.bytecodes.append(bytecode.pushdouble(node.value))
-        elif isinstance(node.value, int):
-            if node.value < 128:
-                self.bytecodes.append(bytecode.pushbyte(node.value))
-            elif node.value < 65536:
-                self.bytecodes.append(bytecode.pushshort(node.value))
-            else:
-                self.bytecodes.append(bytecode.pushint(node.value))
-        else:
-            raise NotImplementedError(node)
+        self.push_constant(node.value)
 
     def _get_meta(self, node):
         if isinstance(node.expr, parser.Name):
@@ -1330,7 +1445,6 @@ class CodeFragment:
         self.execute(node.expr1, void)
         self.bytecodes.append(bytecode.coerce_a())
         self.bytecodes.append(bytecode.jump(endlabel))
-        self.bytecodes.append(bytecode.pop())
         self.bytecodes.append(lab)
         self.execute(node.expr2, void)
         self.bytecodes.append(bytecode.coerce_a())
@@ -1482,15 +1596,18 @@ class CodeFragment:
 
     @binary
     def visit_add(self, node):
-        self.bytecodes.append(bytecode.add())
+        self.bytecodes.append(self.arith_bytecode(parser.Add,
+            self.expr_type(node.left), self.expr_type(node.right)))
 
     @binary
     def visit_subtract(self, node):
-        self.bytecodes.append(bytecode.subtract())
+        self.bytecodes.append(self.arith_bytecode(parser.Subtract,
+            self.expr_type(node.left), self.expr_type(node.right)))
 
     @binary
     def visit_multiply(self, node):
-        self.bytecodes.append(bytecode.multiply())
+        self.bytecodes.append(self.arith_bytecode(parser.Multiply,
+            self.expr_type(node.left), self.expr_type(node.right)))
 
     @binary
     def visit_divide(self, node):
@@ -1777,6 +1894,23 @@ def get_options():
              " `basename` - filename without path",
         dest="debug_filenames", default="full", type="choice",
         choices=("full", "basename"))
+    op.add_option('-z', '--compression', metavar="LEVEL",
+        help="Compression of output swf: `none` (uncompressed, for fast "
+            "development builds), `fast`, `default` or `max`",
+        dest="compression", default="default", type="choice",
+        choices=tuple(swf.COMPRESSION))
+    op.add_option('-b', '--bitmap', metavar="CLASS=FILE",
+        help="Embed PNG image FILE as bitmap data of CLASS (repeatable). "
+            "CLASS must be defined in the code and extend BitmapData",
+        dest="bitmaps", default=[], action="append", type="string")
+    op.add_option('--link',
+        help="Merge code of all files into single DoABC tag with shared "
+            "constant pool (smaller output, faster loading)",
+        dest="link_code", default=False, action="store_true")
+    op.add_option('-S', '--size-report',
+        help="Print sizes of constant pool sections and whole tag for each"
+            " DoABC tag",
+        dest="size_report", default=False, action="store_true")
     return op
 
 def print_error(e):
@@ -1809,9 +1943,31 @@ def make_globals(lib, std_globals=True):
         glob.namespace['bool'] = Class(lib.get_class('', 'Boolean'))
     return glob
 
+def link(code_headers, name=''):
+    """
+    Merges ABC files of all ``code_headers`` into a single DoABC tag, so that
+    names and constants shared by modules are written to the constant pool
+    only once. Note that player runs only the last script of ABC file on
+    load, scripts of other modules are run when their names are first used
+    """
+    tag = abc.DoABC()
+    tag.flags = 0
+    tag.name = name
+    tag.empty()
+    body = tag.real_body
+    for header in code_headers:
+        src = header.tag.real_body
+        body.method_info.extend(src.method_info)
+        body.class_info.extend(src.class_info)
+        body.script_info.extend(src.script_info)
+        body.method_body_info.extend(src.method_body_info)
+    return tag
+
 def compile(files, lib, glob, output, main_class,
-        width=500, height=375, frame_rate=15, filenames='full'):
-    code_tags = []
+        width=500, height=375, frame_rate=15, filenames='full',
+        compression='default', bitmaps=(), link_code=False,
+        size_report=False):
+    code_headers = []
     for file in files:
         if hasattr(file, 'read'):
             ast = parser.parser().parse_stream(file, name=file.name)
@@ -1829,19 +1985,35 @@ def compile(files, lib, glob, output, main_class,
             parent_namespaces=(glob,))
         code_header.add_method_body('', frag)
         code_header.add_main_script(frag)
-        code_tags.append(code_header.make_tag())
+        code_headers.append(code_header)
+    if link_code:
+        code_tags = [link(code_headers, main_class)]
+    else:
+        code_tags = [header.make_tag() for header in code_headers]
     h = swf.Header(frame_size=(int(width*20), int(height*20)),
                    frame_rate=int(frame_rate*256))
+    bitmaps = [assets.Bitmap.load(name, fname) for name, fname in bitmaps]
+    bitmap_tags = assets.embed_bitmaps(bitmaps)
+    ids = [tag.character_id for tag in bitmap_tags]
+    # classes embedding the same image are bound to the single character
+    bitmap_tags, remap, saved = dedup.merge(bitmap_tags)
+    symbols = tags.SymbolClass(main_class=main_class)
+    for bmp, cid in zip(bitmaps, ids):
+        symbols.assoc.append((remap.get(cid, cid), bmp.class_name))
     content = [tags.FileAttributes()] \
-        + code_tags + [
-        tags.SymbolClass(main_class=main_class),
+        + bitmap_tags + code_tags + [
+        symbols,
         tags.ShowFrame(),
         ]
+    content = list(chain.from_iterable(map(methodcaller('buffers'), content)))
+    if size_report:
+        for tag in code_tags:
+            swf.print_size_report(tag)
     if hasattr(output, 'write'):
-        h.write_swf(output, b''.join(map(methodcaller('blob'), content)))
+        h.write_swf(output, content, compression=compression)
     else:
         with open(output, 'wb') as o:
-            h.write_swf(o, b''.join(map(methodcaller('blob'), content)))
+            h.write_swf(o, content, compression=compression)
 
 def main():
     global options
@@ -1865,11 +2037,18 @@ def main():
     for i, val in enumerate(args):
         if val == '-':
             args[i] = sys.stdin.buffer
+    bitmaps = []
+    for val in options.bitmaps:
+        if '=' not in val:
+            op.error("Bitmap must be specified as CLASS=FILE")
+        bitmaps.append(tuple(val.split('=', 1)))
     glob = make_globals(lib, std_globals=options.std_globals)
     try:
         compile(args, lib, glob, out, main_class=options.main_class,
             width=options.width, height=options.height,
-            frame_rate=options.frame_rate, filenames=options.debug_filenames)
+            frame_rate=options.frame_rate, filenames=options.debug_filenames,
+            compression=options.compression, bitmaps=bitmaps,
+            link_code=options.link_code, size_report=options.size_report)
     except (parser.SyntaxError, SyntaxError) as e:
         print_error(e)
         return
@@ -117,8 +117,8 @@ def _makedeps(fullname):
         imports, exports = visit(ast)
         return {
             'time': os.path.getmtime(fullname),
-            'exports': list(exports),
-            'imports': list(imports),
+            'exports': sorted(exports),
+            'imports': sorted(imports),
             }
     elif ext in ('.swf', '.swc'):
         ex = list(library.get_public_names(fullname))
@@ -183,8 +183,8 @@ def update_dependencies(dependencies, recipe):
     if needed:
         for dir in recipe['Global'].get('pyzza-path', ()):
             for root, dirs, files in os.walk(os.path.join(recipe['_dir'], dir)):
-                dirs[:] = [i for i in dirs if not i.startswith('.')]
-                for f in files:
+                dirs[:] = sorted(i for i in dirs if not i.startswith('.'))
+                for f in sorted(files):
                     if os.path.splitext(f)[1] != '.py':
                         continue
                     fullname = os.path.realpath(os.path.join(root, f))
@@ -221,20 +221,31 @@ def build(files, output, recipe, info):
     for fname in recipe['Global'].get('libraries', ()):
         lib.add_file(fname)
     filename_mode = recipe['Global'].get('debug-filename', 'full')
+    compression = info.get('compression',
+        recipe['Global'].get('compression', 'default'))
+    bitmaps = sorted(bitmap_files(recipe, info).items())
+    link_code = info.get('link', recipe['Global'].get('link', False))
     try:
         compile.compile((f for f in files if f.endswith('.py')),
             lib, compile.make_globals(lib), output,
             width=info.get('width', 500), height=info.get('height', 375),
             frame_rate=info.get('frame-rate', 15),
             main_class=info.get('main-class', 'Main'),
-            filenames=filename_mode)
+            filenames=filename_mode, compression=compression,
+            bitmaps=bitmaps, link_code=link_code)
     except (compile.SyntaxError, parser.SyntaxError) as e:
         compile.print_error(e)
 
+def bitmap_files(recipe, info):
+    """Returns dict of class names to absolute paths of images which are
+    embedded into the target (``bitmaps`` key of the target)"""
+    return {name: os.path.join(recipe['_dir'], fname)
+        for name, fname in info.get('bitmaps', {}).items()}
+
 def files(src, dependencies):
     all = [src]
     for fname in all:
-        for dname in dependencies[fname].get('depends', ()):
+        for dname in sorted(dependencies[fname].get('depends', ())):
             if fname in dependencies[dname].get('depends', ()):
                 warnings.warn("Circular dependency between {0!r} and {1!r}"
                     .format(fname, dname))
@@ -262,6 +273,10 @@ def make(recipe, dependencies, force=False, verbosity=0):
                     if dependencies[f]['time'] > targtime:
                         need_build = True
                         break
+                for f in bitmap_files(recipe, info).values():
+                    if os.path.getmtime(f) > targtime:
+                        need_build = True
+                        break
             if need_build:
                 if verbosity > 1:
                     print("File {0!r} will be build from the following sources:"
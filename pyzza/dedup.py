@@ -0,0 +1,170 @@
+import struct
+import hashlib
+import warnings
+
+from . import tags, graphics
+
+# define tags which can be merged if bodies (without character id) are same
+DEFINE_CODES = frozenset((
+    6, # DefineBits
+    21, # DefineBitsJPEG2
+    35, # DefineBitsJPEG3
+    90, # DefineBitsJPEG4
+    tags.TAG_DefineBitsLossless,
+    tags.TAG_DefineBitsLossless2,
+    tags.TAG_DefineShape,
+    tags.TAG_DefineShape2,
+    tags.TAG_DefineShape3,
+    tags.TAG_DefineShape4,
+    tags.TAG_DefineSprite,
+    tags.TAG_DefineBinaryData,
+    ))
+
+# tags which start with character id of some previously defined character
+REFERENCE_CODES = frozenset((
+    tags.TAG_PlaceObject,
+    tags.TAG_RemoveObject,
+    tags.TAG_DefineScalingGrid,
+    ))
+
+# tags which don't refer to any character that may be merged, or references
+# in which are rewritten
+SAFE_CODES = frozenset((
+    tags.TAG_End,
+    tags.TAG_PlaceObject2,
+    tags.TAG_PlaceObject3,
+    tags.TAG_ShowFrame,
+    8, # JPEGTables
+    tags.TAG_SetBackgroundColor,
+    10, 48, 75, 91, # DefineFont, DefineFont2, DefineFont3, DefineFont4
+    73, 88, # DefineFontAlignZones, DefineFontName
+    11, 33, 37, # DefineText, DefineText2, DefineEditText
+    12, 59, # DoAction, DoInitAction
+    14, 15, 89, # DefineSound, StartSound, StartSound2
+    18, 19, 45, # SoundStreamHead, SoundStreamBlock, SoundStreamHead2
+    60, 61, # DefineVideoStream, VideoFrame
+    tags.TAG_Protect,
+    tags.TAG_RemoveObject2,
+    41, 63, # ProductInfo, DebugID
+    tags.TAG_FrameLabel,
+    tags.TAG_ExportAssets,
+    tags.TAG_EnableDebugger,
+    tags.TAG_EnableDebugger2,
+    tags.TAG_ScriptLimits,
+    tags.TAG_SetTabIndex,
+    tags.TAG_FileAttributes,
+    72, # DoABC without flags
+    tags.TAG_SymbolClass,
+    tags.TAG_Metadata,
+    tags.TAG_DefineSceneAndFrameLabelData,
+    tags.TAG_DoABC,
+    )) | DEFINE_CODES | REFERENCE_CODES
+
+def _sprite_tags(tag):
+    """Returns list of control tags of DefineSprite"""
+    return [t for (code, body, t) in tags.iterate(tag.data[4:])]
+
+def _unsafe_codes(taglist):
+    res = set()
+    for tag in taglist:
+        if tag.code not in SAFE_CODES:
+            res.add(tag.code)
+        elif tag.code == tags.TAG_DefineSprite:
+            res.update(_unsafe_codes(_sprite_tags(tag)))
+    return res
+
+def _exported_ids(taglist):
+    """Returns ids which are bound to classes or exported by name, such
+    characters are never merged"""
+    res = set()
+    for tag in taglist:
+        if tag.code == tags.TAG_SymbolClass:
+            res.update(cid for (cid, name) in tag.assoc)
+        elif tag.code == tags.TAG_ExportAssets:
+            stream = tag.data
+            count, = struct.unpack_from('<H', stream)
+            pos = 2
+            for i in range(count):
+                res.add(struct.unpack_from('<H', stream, pos)[0])
+                pos = stream.index(b'\x00', pos + 2) + 1
+    return res
+
+def _remap_styles(styles, remap):
+    changed = False
+    for style in styles:
+        fill = getattr(style, 'fill', style)
+        if fill is not None and fill.bitmap_id in remap:
+            fill.bitmap_id = remap[fill.bitmap_id]
+            changed = True
+    return changed
+
+def _rewrite(tag, remap):
+    """Replaces references to merged characters in the tag"""
+    if isinstance(tag, graphics.PlaceObject2):
+        if tag.character_id in remap:
+            tag.character_id = remap[tag.character_id]
+    elif isinstance(tag, graphics.DefineShape):
+        shape = tag.shape
+        changed = _remap_styles(shape.fill_styles, remap)
+        changed |= _remap_styles(shape.line_styles, remap)
+        for rec in shape.records:
+            if getattr(rec, 'new_styles', None):
+                changed |= _remap_styles(rec.new_styles[0], remap)
+                changed |= _remap_styles(rec.new_styles[1], remap)
+        if changed:
+            tag.dirty = True
+    elif tag.code in REFERENCE_CODES:
+        cid, = struct.unpack_from('<H', tag.data)
+        if cid in remap:
+            tag.data = struct.pack('<H', remap[cid]) + tag.data[2:]
+    elif tag.code == tags.TAG_DefineSprite:
+        nested = _sprite_tags(tag)
+        for t in nested:
+            _rewrite(t, remap)
+        tag.data = tag.data[:4] + b''.join(t.blob() for t in nested)
+
+def dedup(taglist):
+    """
+    Removes define tags which are the same as one of the previous define
+    tags except character id, references to removed characters are replaced
+    by the id of the first one. Returns tuple ``(taglist, saved_bytes)``.
+
+    If there are tags which may refer to characters but can't be rewritten
+    (e.g. buttons), tags are returned unchanged
+    """
+    taglist, remap, saved = merge(taglist)
+    return taglist, saved
+
+def merge(taglist):
+    """
+    Same as ``dedup`` but returns tuple ``(taglist, remap, saved_bytes)``,
+    where ``remap`` maps ids of removed characters to the ids of kept ones.
+    Used by compiler to bind several classes to the single character before
+    ``SymbolClass`` tag is made
+    """
+    taglist = list(taglist)
+    unsafe = _unsafe_codes(taglist)
+    if unsafe:
+        warnings.warn("Deduplication is skipped because of unsupported"
+            " tags {0}".format(sorted(unsafe)))
+        return taglist, {}, 0
+    exported = _exported_ids(taglist)
+    remap = {}
+    seen = {}
+    res = []
+    saved = 0
+    for tag in taglist:
+        if remap:
+            _rewrite(tag, remap)
+        if tag.code in DEFINE_CODES:
+            buffers = tag.buffers()
+            cid, = struct.unpack_from('<H', tag.data)
+            key = (tag.code, hashlib.sha1(tag.data[2:]).digest())
+            orig = seen.get(key)
+            if orig is not None and cid not in exported:
+                remap[cid] = orig
+                saved += sum(map(len, buffers))
+                continue
+            seen.setdefault(key, cid)
+        res.append(tag)
+    return res, remap, saved
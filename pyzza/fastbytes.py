@@ -1,11 +1,194 @@
 from . import bytecode
 
+# bytecodes after which execution never continues to the next bytecode
+TERMINATORS = (
+    bytecode.jump,
+    bytecode.returnvalue,
+    bytecode.returnvoid,
+    bytecode.throw,
+    )
+# conditional jumps and jumps with negated condition
+INVERSE_JUMPS = {
+    bytecode.iftrue: bytecode.iffalse,
+    bytecode.ifeq: bytecode.ifne,
+    bytecode.ifstricteq: bytecode.ifstrictne,
+    bytecode.iflt: bytecode.ifnlt,
+    bytecode.ifle: bytecode.ifnle,
+    bytecode.ifgt: bytecode.ifngt,
+    bytecode.ifge: bytecode.ifnge,
+    }
+INVERSE_JUMPS.update([(v, k) for (k, v) in list(INVERSE_JUMPS.items())])
+# short forms of getlocal and setlocal for registers 0..3
+GETLOCALS = (
+    bytecode.getlocal_0,
+    bytecode.getlocal_1,
+    bytecode.getlocal_2,
+    bytecode.getlocal_3,
+    )
+SETLOCALS = (
+    bytecode.setlocal_0,
+    bytecode.setlocal_1,
+    bytecode.setlocal_2,
+    bytecode.setlocal_3,
+    )
+# bytecodes which always leave int on the stack, so ``convert_i`` after them
+# does nothing
+INT_RESULTS = (
+    bytecode.add_i,
+    bytecode.subtract_i,
+    bytecode.multiply_i,
+    bytecode.negate_i,
+    bytecode.increment_i,
+    bytecode.decrement_i,
+    bytecode.bitand,
+    bytecode.bitor,
+    bytecode.bitxor,
+    bytecode.bitnot,
+    bytecode.lshift,
+    bytecode.rshift,
+    bytecode.convert_i,
+    bytecode.pushbyte,
+    bytecode.pushshort,
+    )
+# int arithmetic with one and the shorter bytecode for it
+INT_STEPS = {
+    bytecode.add_i: bytecode.increment_i,
+    bytecode.subtract_i: bytecode.decrement_i,
+    }
+# incrementing bytecodes and their in-register versions
+LOCAL_STEPS = {
+    bytecode.increment_i: bytecode.inclocal_i,
+    bytecode.decrement_i: bytecode.declocal_i,
+    }
+# limit of the passes over the method, just in case some rules don't
+# converge
+MAX_PASSES = 100
+
+# registry of the peephole rules, see ``rule``
+rules = []
+
+def rule(fun):
+    """
+    Registers peephole rule. Rule is called as ``fun(graph)`` where ``graph``
+    is ``FlowGraph``, it rewrites blocks in place and returns True if
+    anything is changed
+    """
+    rules.append(fun)
+    return fun
+
+class Block(object):
+    """
+    Basic block: list of labels pointing to the start of the block and list
+    of bytecodes, only the last one may be a jump or a terminator
+    """
+    __slots__ = ('labels', 'code')
+
+    def __init__(self):
+        self.labels = []
+        self.code = []
+
+    @property
+    def last(self):
+        if self.code:
+            return self.code[-1]
+
+    def falls_through(self):
+        return not isinstance(self.last, TERMINATORS)
+
+    def __repr__(self):
+        return '<Block {0!r} {1!r}>'.format(self.labels, self.code)
+
+class FlowGraph(object):
+    """Bytecodes of the method split into basic blocks"""
+
+    def __init__(self, codes, exceptions=()):
+        self.exceptions = exceptions
+        self.blocks = split_blocks(codes)
+        # rules which make stack deeper set this to the maximum increase
+        self.extra_stack = 0
+
+    def bytecodes(self):
+        res = []
+        for block in self.blocks:
+            res.extend(block.labels)
+            res.extend(block.code)
+        return res
+
+    def rebuild(self):
+        """Splits blocks again, needed when labels are removed"""
+        self.blocks = split_blocks(self.bytecodes())
+
+    def label_blocks(self):
+        """Returns dict which maps label to the index of its block"""
+        res = {}
+        for (i, block) in enumerate(self.blocks):
+            for lab in block.labels:
+                res[lab] = i
+        return res
+
+    def jump_labels(self):
+        """Labels which are targets of some jumps"""
+        res = set()
+        for block in self.blocks:
+            if isinstance(block.last, bytecode.JumpBytecode):
+                res.add(block.last.offset)
+        return res
+
+    def exception_labels(self):
+        """Labels referenced by exception table, they are never removed"""
+        res = set()
+        for exc in self.exceptions:
+            res.add(exc.exc_from)
+            res.add(exc.exc_to)
+            res.add(exc.target)
+        return res
+
+def split_blocks(codes):
+    blocks = [Block()]
+    for code in codes:
+        cur = blocks[-1]
+        if isinstance(code, bytecode.Label):
+            if cur.code:
+                cur = Block()
+                blocks.append(cur)
+            cur.labels.append(code)
+        else:
+            cur.code.append(code)
+            if isinstance(code, (bytecode.JumpBytecode,) + TERMINATORS):
+                blocks.append(Block())
+    if len(blocks) > 1 and not blocks[-1].labels and not blocks[-1].code:
+        blocks.pop()
+    return blocks
+
 def optimize(tag):
+    tag.dirty = True
     for meth in tag.real_body.method_body_info:
         optimize_method(meth)
 
 def optimize_method(meth):
-    meth.bytecode = list(clean_nops(meth.bytecode))
+    for offset, code in meth.instructions():
+        if isinstance(code, bytecode.lookupswitch):
+            # switch offsets are not converted to labels, so such methods
+            # can't be restructured and are written unchanged
+            return
+    graph = run_rules(FlowGraph(clean_nops(meth.bytecode),
+        meth.exception_info))
+    meth.bytecode = graph.bytecodes()
+    meth.max_stack += graph.extra_stack
+
+def optimize_code(codes, exceptions=()):
+    """Runs all peephole rules on ``codes`` until nothing changes, returns new
+    list of bytecodes. Registers must already be allocated"""
+    return run_rules(FlowGraph(codes, exceptions)).bytecodes()
+
+def run_rules(graph):
+    for i in range(MAX_PASSES):
+        changed = False
+        for fun in rules:
+            changed |= bool(fun(graph))
+        if not changed:
+            break
+    return graph
 
 def clean_nops(bytecodes):
     cleanbc = (
@@ -17,3 +200,206 @@ def clean_nops(bytecodes):
     for code in bytecodes:
         if not isinstance(code, cleanbc):
             yield code
+
+def get_register(code):
+    """Returns register which is read by getlocal bytecode or None"""
+    if isinstance(code, bytecode.getlocal):
+        return code.register
+    if isinstance(code, GETLOCALS):
+        return GETLOCALS.index(code.__class__)
+
+def set_register(code):
+    """Returns register which is written by setlocal bytecode or None"""
+    if isinstance(code, bytecode.setlocal):
+        return code.value
+    if isinstance(code, SETLOCALS):
+        return SETLOCALS.index(code.__class__)
+
+def can_jump(label, source, target):
+    """Checks if jump from the block with index ``source`` may go to the
+    ``label`` at block ``target``, backward jumps must point to ``label``
+    bytecode"""
+    return target > source or isinstance(label, bytecode.label)
+
+@rule
+def thread_jumps(graph):
+    """Replaces jump to another jump by the jump to the final target"""
+    changed = False
+    blocks = graph.blocks
+    labels = graph.label_blocks()
+    for (i, block) in enumerate(blocks):
+        last = block.last
+        if not isinstance(last, bytecode.JumpBytecode):
+            continue
+        target = last.offset
+        seen = {target}
+        while True:
+            code = blocks[labels[target]].code
+            if len(code) != 1 or not isinstance(code[0], bytecode.jump):
+                break
+            target = code[0].offset
+            if target in seen:
+                break # infinite loop
+            seen.add(target)
+            if can_jump(target, i, labels[target]):
+                last.offset = target
+                changed = True
+    return changed
+
+@rule
+def invert_jumps(graph):
+    """
+    Replaces conditional jump over unconditional jump by the single jump with
+    inverse condition::
+
+        iftrue L1; jump L2; L1: ...  ->  iffalse L2; L1: ...
+    """
+    changed = False
+    blocks = graph.blocks
+    i = 0
+    while i < len(blocks) - 2:
+        last = blocks[i].last
+        over = blocks[i+1]
+        if (last.__class__ in INVERSE_JUMPS and not over.labels
+            and len(over.code) == 1 and isinstance(over.code[0], bytecode.jump)
+            and last.offset in blocks[i+2].labels):
+            blocks[i].code[-1] = INVERSE_JUMPS[last.__class__](
+                over.code[0].offset)
+            del blocks[i+1]
+            changed = True
+        i += 1
+    return changed
+
+@rule
+def zero_jumps(graph):
+    """Removes jumps to the label which is just after the jump, operands of
+    conditional jumps are popped"""
+    changed = False
+    blocks = graph.blocks
+    for block, next in zip(blocks, blocks[1:]):
+        last = block.last
+        if isinstance(last, bytecode.JumpBytecode) and last.offset in next.labels:
+            block.code[-1:] = [bytecode.pop() for i in last.stack_before]
+            changed = True
+    return changed
+
+@rule
+def unreachable_blocks(graph):
+    """
+    Removes code which can't be reached from the start of the method or from
+    exception handlers, e.g. ``returnvoid`` which is added after
+    ``returnvalue`` at the end of the function. Labels used by exception
+    table are kept
+    """
+    blocks = graph.blocks
+    labels = graph.label_blocks()
+    exc_labels = graph.exception_labels()
+    reachable = set()
+    queue = [0]
+    queue.extend(labels[exc.target] for exc in graph.exceptions)
+    while queue:
+        i = queue.pop()
+        if i in reachable or i >= len(blocks):
+            continue
+        reachable.add(i)
+        block = blocks[i]
+        if isinstance(block.last, bytecode.JumpBytecode):
+            queue.append(labels[block.last.offset])
+        if block.falls_through():
+            queue.append(i+1)
+    changed = False
+    res = []
+    for (i, block) in enumerate(blocks):
+        if i not in reachable:
+            if block.code or len(exc_labels.intersection(block.labels)) \
+                != len(block.labels):
+                changed = True
+            block.labels = [l for l in block.labels if l in exc_labels]
+            block.code = []
+            if not block.labels:
+                continue
+        res.append(block)
+    blocks[:] = res
+    return changed
+
+@rule
+def unused_labels(graph):
+    """Removes labels which are not referenced by jumps or exceptions"""
+    used = graph.jump_labels() | graph.exception_labels()
+    changed = False
+    for block in graph.blocks:
+        if not all(lab in used for lab in block.labels):
+            block.labels = [lab for lab in block.labels if lab in used]
+            changed = True
+    if changed:
+        graph.rebuild()
+    return changed
+
+@rule
+def int_steps(graph):
+    """
+    Replaces int arithmetic with one and the following conversion::
+
+        pushbyte 1; add_i; convert_i  ->  increment_i
+        getlocal r; increment_i; setlocal r  ->  inclocal_i r
+    """
+    changed = False
+    for block in graph.blocks:
+        code = block.code
+        i = 0
+        while i < len(code):
+            bcode = code[i]
+            if isinstance(bcode, bytecode.convert_i) and i > 0 \
+                and isinstance(code[i-1], INT_RESULTS):
+                del code[i]
+                changed = True
+                continue
+            if bcode.__class__ in INT_STEPS and i > 0 \
+                and isinstance(code[i-1], bytecode.pushbyte) \
+                and code[i-1].byte_value == 1:
+                code[i-1:i+1] = [INT_STEPS[bcode.__class__]()]
+                changed = True
+                continue
+            if bcode.__class__ in LOCAL_STEPS and 0 < i < len(code) - 1:
+                reg = get_register(code[i-1])
+                if reg is not None and reg == set_register(code[i+1]):
+                    code[i-1:i+2] = [LOCAL_STEPS[bcode.__class__](
+                        bytecode.Register(reg))]
+                    changed = True
+                    continue
+            i += 1
+    return changed
+
+@rule
+def fuse_locals(graph):
+    """Replaces ``setlocal r; getlocal r`` by ``dup; setlocal r``"""
+    changed = False
+    for block in graph.blocks:
+        code = block.code
+        for i in range(len(code) - 1):
+            reg = set_register(code[i])
+            if reg is not None and reg == get_register(code[i+1]):
+                code[i:i+2] = [bytecode.dup(), code[i]]
+                changed = True
+    if changed:
+        # value is on the stack while it's stored, but stack is never deeper
+        # than one more value than before
+        graph.extra_stack = 1
+    return changed
+
+@rule
+def short_locals(graph):
+    """Replaces getlocal and setlocal of registers 0..3 by short bytecodes"""
+    changed = False
+    for block in graph.blocks:
+        code = block.code
+        for (i, bcode) in enumerate(code):
+            if isinstance(bcode, bytecode.getlocal) \
+                and bcode.register < len(GETLOCALS):
+                code[i] = GETLOCALS[bcode.register]()
+                changed = True
+            elif isinstance(bcode, bytecode.setlocal) \
+                and bcode.value < len(SETLOCALS):
+                code[i] = SETLOCALS[bcode.value]()
+                changed = True
+    return changed
@@ -0,0 +1,209 @@
+import math
+import operator
+from collections import defaultdict
+
+from . import parser
+
+# integers bigger than this can't be represented exactly as Number
+MAX_EXACT = 2**53
+
+class NotConstant(Exception):
+    """Raised when expression can't be evaluated at compile time"""
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def to_int32(value):
+    """ToInt32 conversion of actionscript, used by bitwise operators"""
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return 0
+        value = int(value)
+    return ((value + 2**31) & 0xFFFFFFFF) - 2**31
+
+def _numbers(a, b):
+    if not is_number(a) or not is_number(b):
+        raise NotConstant(a, b)
+
+def _float(value):
+    try:
+        return float(value)
+    except OverflowError: # int literal is too big even for Number
+        raise NotConstant(value)
+
+def _arith(op):
+    def fun(a, b):
+        _numbers(a, b)
+        res = op(a, b)
+        if isinstance(res, int) and (abs(res) > MAX_EXACT
+            or not res and op is operator.mul):
+            # computed on Numbers, e.g. ``0 * -1`` is negative zero
+            res = op(_float(a), _float(b))
+        return res
+    return fun
+
+def _add(a, b):
+    if isinstance(a, str) and isinstance(b, str):
+        return a + b
+    return _arith(operator.add)(a, b)
+
+def _divide(a, b):
+    _numbers(a, b)
+    if not b:
+        raise NotConstant(a, b)
+    return _float(a) / _float(b)
+
+def _modulo(a, b):
+    _numbers(a, b)
+    if not b:
+        raise NotConstant(a, b)
+    # sign of the result is the sign of dividend, like in C
+    return math.fmod(_float(a), _float(b))
+
+def _bitwise(op):
+    def fun(a, b):
+        _numbers(a, b)
+        return to_int32(op(to_int32(a), to_int32(b)))
+    return fun
+
+def _shift(op):
+    def fun(a, b):
+        _numbers(a, b)
+        return to_int32(op(to_int32(a), to_int32(b) & 31))
+    return fun
+
+def _equality(op):
+    def fun(a, b):
+        if not isinstance(a, (int, float, str)) \
+            or not isinstance(b, (int, float, str)) \
+            or isinstance(a, bool) != isinstance(b, bool):
+            # bool is int in python, but ``true === 1`` is false
+            raise NotConstant(a, b)
+        return op(a, b)
+    return fun
+
+def _compare(op):
+    def fun(a, b):
+        if isinstance(a, str) and isinstance(b, str):
+            # strings are compared by UTF-16 code units, which is the same
+            # as python order only for the basic plane before surrogates
+            if max(a + b, default='') >= '\ud800':
+                raise NotConstant(a, b)
+        else:
+            _numbers(a, b)
+        return op(a, b)
+    return fun
+
+operators = {
+    parser.Add: _add,
+    parser.Subtract: _arith(operator.sub),
+    parser.Multiply: _arith(operator.mul),
+    parser.Divide: _divide,
+    parser.Modulo: _modulo,
+    parser.BitAnd: _bitwise(operator.and_),
+    parser.BitOr: _bitwise(operator.or_),
+    parser.BitXor: _bitwise(operator.xor),
+    parser.Shl: _shift(operator.lshift),
+    parser.Shr: _shift(operator.rshift),
+    parser.Equal: _equality(operator.eq),
+    parser.NotEqual: _equality(operator.ne),
+    parser.Greater: _compare(operator.gt),
+    parser.GreaterEq: _compare(operator.ge),
+    parser.Less: _compare(operator.lt),
+    parser.LessEq: _compare(operator.le),
+    }
+
+# nodes which may be replaced by the constant
+FOLDABLE = (parser.Name, parser.Negate) + tuple(operators)
+
+def _no_names(name):
+    raise NotConstant(name)
+
+def evaluate(node, lookup=_no_names):
+    """
+    Returns value of the expression ``node`` if it consists only of number
+    and string literals and names for which ``lookup(name)`` returns value,
+    otherwise raises ``NotConstant``. Result is computed as actionscript does
+    """
+    if isinstance(node, (parser.Number, parser.String)):
+        return node.value
+    if isinstance(node, parser.Name):
+        return lookup(node.value)
+    if isinstance(node, parser.Negate):
+        value = evaluate(node.expr, lookup)
+        if not is_number(value):
+            raise NotConstant(node)
+        if not value:
+            return -float(value) # negative zero
+        return -value
+    fun = operators.get(type(node))
+    if fun is None:
+        raise NotConstant(node)
+    return fun(evaluate(node.left, lookup), evaluate(node.right, lookup))
+
+class Bindings:
+    """
+    Collects nodes which bind each name in the scope: assignments, loops,
+    except clauses, imports, ``del``, functions and classes. Names local to
+    nested functions and classes are skipped
+    """
+
+    def __init__(self, body):
+        self.nodes = defaultdict(list)
+        for node in body:
+            self.visit(node)
+
+    def visit(self, node):
+        if isinstance(node, (parser.Func, parser.Class)):
+            self.nodes[node.name.value].append(node)
+            return
+        if isinstance(node, parser.Assign):
+            self.bind(node.target, node)
+        elif isinstance(node, parser.For):
+            for var in node.var:
+                self.bind(var, node)
+        elif isinstance(node, parser.Try):
+            for (typ, var, body) in node.excepts:
+                if var is not None:
+                    self.bind(var, node)
+        elif isinstance(node, parser.Del):
+            self.bind(node.expr, node)
+        elif isinstance(node, parser.ImportStmt):
+            for name in node.names:
+                self.bind(getattr(name, 'alias', name), node)
+        try:
+            children = iter(node)
+        except (AttributeError, TypeError):
+            return # leaf node
+        for child in children:
+            if child is not None:
+                self.visit(child)
+
+    def bind(self, target, node):
+        if isinstance(target, parser.Name):
+            self.nodes[target.value].append(node)
+        elif isinstance(target, parser.Tuple):
+            for item in target:
+                self.bind(item, node)
+
+def module_constants(body):
+    """
+    Returns dict of names which are assigned exactly once in the module
+    ``body``, by the top-level assignment of constant expression
+    """
+    bindings = Bindings(body).nodes
+    res = {}
+    def lookup(name):
+        try:
+            return res[name]
+        except KeyError:
+            raise NotConstant(name)
+    for node in body:
+        if isinstance(node, parser.Assign) and node.operator.value == '=' \
+            and isinstance(node.target, parser.Name) \
+            and len(bindings[node.target.value]) == 1:
+            try:
+                res[node.target.value] = evaluate(node.expr, lookup)
+            except NotConstant:
+                pass
+    return res
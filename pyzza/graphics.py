@@ -0,0 +1,804 @@
+import zlib
+import struct
+
+from . import io, swf
+from .tags import (Tag,
+    TAG_PlaceObject2, TAG_PlaceObject3,
+    TAG_DefineShape, TAG_DefineShape2, TAG_DefineShape3, TAG_DefineShape4,
+    TAG_DefineBitsLossless, TAG_DefineBitsLossless2)
+
+class LazyTag(Tag):
+    """
+    Tag which parses its data on first access to any of ``fields``. When
+    written, original data is reused unless tag is ``dirty``. Assigning any
+    field marks tag dirty, code which changes fields in place (e.g. appends
+    to the list of records) must set ``dirty`` itself
+    """
+    fields = ()
+    dirty = True
+
+    def _read(self, stream):
+        super()._read(stream)
+        # drop defaults set by constructor, fields are decoded on access
+        for name in self.fields:
+            self.__dict__.pop(name, None)
+        self.dirty = False
+
+    def _parse(self):
+        d = self.__dict__
+        d['_parsed'] = d['_parsing'] = True
+        try:
+            self._decode(io.BitStream(d['data']))
+        finally:
+            del d['_parsing']
+
+    def __getattr__(self, name):
+        d = self.__dict__
+        if name in self.fields and 'data' in d and '_parsed' not in d:
+            self._parse()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in self.fields:
+            d = self.__dict__
+            if '_parsing' not in d:
+                if 'data' in d and '_parsed' not in d:
+                    self._parse()
+                d['dirty'] = True
+        super().__setattr__(name, value)
+
+    def buffers(self):
+        if self.dirty:
+            writer = io.BitWriter()
+            self._encode(writer)
+            self.data = writer.getvalue()
+        return super().buffers()
+
+def _read_u8(stream):
+    return stream.readbytes(1).int_le
+
+def _read_u16(stream):
+    return stream.readbytes(2).int_le
+
+def _read_color(stream, alpha):
+    return tuple(stream.readbytes(4 if alpha else 3).bytes)
+
+class Matrix(object):
+    """MATRIX record, values are kept as raw fixed point (16.16 for scale and
+    rotate, twips for translate)"""
+
+    def __init__(self, scale=None, rotate=None, translate=(0, 0)):
+        self.scale = scale
+        self.rotate = rotate
+        self.translate = translate
+
+    @classmethod
+    def read(cls, stream):
+        self = cls()
+        stream.align()
+        if stream.readbits(1):
+            bitlen = stream.readbits(5)
+            self.scale = (stream.readsbits(bitlen), stream.readsbits(bitlen))
+        if stream.readbits(1):
+            bitlen = stream.readbits(5)
+            self.rotate = (stream.readsbits(bitlen), stream.readsbits(bitlen))
+        bitlen = stream.readbits(5)
+        self.translate = (stream.readsbits(bitlen), stream.readsbits(bitlen))
+        return self
+
+    def write(self, writer):
+        writer.align()
+        for pair in (self.scale, self.rotate):
+            if pair is None:
+                writer.writebits(1, 0)
+            else:
+                writer.writebits(1, 1)
+                self._write_pair(writer, pair)
+        self._write_pair(writer, self.translate)
+        writer.align()
+
+    @staticmethod
+    def _write_pair(writer, pair):
+        bitlen = io.sbits(*pair)
+        writer.writebits(5, bitlen)
+        writer.writesbits(bitlen, pair[0])
+        writer.writesbits(bitlen, pair[1])
+
+    def __eq__(self, other):
+        return (isinstance(other, Matrix) and self.scale == other.scale
+            and self.rotate == other.rotate
+            and self.translate == other.translate)
+
+    def __repr__(self):
+        return '<Matrix scale:{0} rotate:{1} translate:{2}>'.format(
+            self.scale, self.rotate, self.translate)
+
+class ColorTransform(object):
+    """CXFORM or CXFORMWITHALPHA record, ``mult`` and ``add`` are tuples of
+    terms (RGB or RGBA) or None"""
+
+    def __init__(self, mult=None, add=None):
+        self.mult = mult
+        self.add = add
+
+    @classmethod
+    def read(cls, stream, alpha=True):
+        self = cls()
+        stream.align()
+        has_add = stream.readbits(1)
+        has_mult = stream.readbits(1)
+        bitlen = stream.readbits(4)
+        count = 4 if alpha else 3
+        if has_mult:
+            self.mult = tuple(stream.readsbits(bitlen) for i in range(count))
+        if has_add:
+            self.add = tuple(stream.readsbits(bitlen) for i in range(count))
+        return self
+
+    def write(self, writer):
+        terms = (self.mult or ()) + (self.add or ())
+        bitlen = io.sbits(*terms) if terms else 0
+        writer.align()
+        writer.writebits(1, self.add is not None)
+        writer.writebits(1, self.mult is not None)
+        writer.writebits(4, bitlen)
+        for v in terms:
+            writer.writesbits(bitlen, v)
+        writer.align()
+
+    def __eq__(self, other):
+        return (isinstance(other, ColorTransform)
+            and self.mult == other.mult and self.add == other.add)
+
+    def __repr__(self):
+        return '<ColorTransform mult:{0} add:{1}>'.format(self.mult, self.add)
+
+# sizes of filter bodies by filter id, except variable sized ones
+_FILTER_SIZES = {
+    0: 23, # DropShadow
+    1: 9, # Blur
+    2: 15, # Glow
+    3: 27, # Bevel
+    6: 80, # ColorMatrix
+    }
+
+def _read_filters(stream):
+    """Reads FILTERLIST, filters are kept as tuples ``(id, raw_body)``"""
+    res = []
+    for i in range(_read_u8(stream)):
+        fid = _read_u8(stream)
+        if fid in _FILTER_SIZES:
+            body = stream.readbytes(_FILTER_SIZES[fid]).bytes
+        elif fid in (4, 7): # GradientGlow, GradientBevel
+            num = stream.readbytes(1).bytes
+            body = num + stream.readbytes(num[0]*5 + 19).bytes
+        elif fid == 5: # Convolution
+            size = stream.readbytes(2).bytes
+            body = size + stream.readbytes(size[0]*size[1]*4 + 13).bytes
+        else:
+            raise ValueError("Unknown filter {0}".format(fid))
+        res.append((fid, body))
+    return res
+
+def _write_filters(writer, filters):
+    writer.writebytes(bytes([len(filters)]))
+    for fid, body in filters:
+        writer.writebytes(bytes([fid]))
+        writer.writebytes(body)
+
+class PlaceObject2(LazyTag):
+    code = TAG_PlaceObject2
+    fields = ('move', 'depth', 'character_id', 'matrix', 'color_transform',
+        'ratio', 'name', 'clip_depth', 'clip_actions')
+
+    def __init__(self, depth=None, character_id=None, matrix=None, move=False):
+        self.move = move
+        self.depth = depth
+        self.character_id = character_id
+        self.matrix = matrix
+        self.color_transform = None
+        self.ratio = None
+        self.name = None
+        self.clip_depth = None
+        self.clip_actions = None
+
+    def _decode_flags(self, stream):
+        return _read_u8(stream)
+
+    def _decode(self, stream):
+        flags = self._decode_flags(stream)
+        self.move = bool(flags & 0x01)
+        self.depth = _read_u16(stream)
+        self._decode_class(stream, flags)
+        self.character_id = _read_u16(stream) if flags & 0x02 else None
+        self.matrix = Matrix.read(stream) if flags & 0x04 else None
+        self.color_transform = (ColorTransform.read(stream)
+            if flags & 0x08 else None)
+        self.ratio = _read_u16(stream) if flags & 0x10 else None
+        self.name = stream.readstring() if flags & 0x20 else None
+        self.clip_depth = _read_u16(stream) if flags & 0x40 else None
+        self._decode_extra(stream)
+        # CLIPACTIONS are kept as is, they are used only for AS1/AS2
+        self.clip_actions = stream.readrest().bytes if flags & 0x80 else None
+
+    def _decode_class(self, stream, flags):
+        pass
+
+    def _decode_extra(self, stream):
+        pass
+
+    def _flags(self):
+        return (int(bool(self.move))
+            | ((self.character_id is not None) << 1)
+            | ((self.matrix is not None) << 2)
+            | ((self.color_transform is not None) << 3)
+            | ((self.ratio is not None) << 4)
+            | ((self.name is not None) << 5)
+            | ((self.clip_depth is not None) << 6)
+            | ((self.clip_actions is not None) << 7))
+
+    def _encode_flags(self, writer):
+        writer.writebytes(bytes([self._flags()]))
+
+    def _encode(self, writer):
+        self._encode_flags(writer)
+        writer.writebytes(struct.pack('<H', self.depth))
+        self._encode_class(writer)
+        if self.character_id is not None:
+            writer.writebytes(struct.pack('<H', self.character_id))
+        if self.matrix is not None:
+            self.matrix.write(writer)
+        if self.color_transform is not None:
+            self.color_transform.write(writer)
+        if self.ratio is not None:
+            writer.writebytes(struct.pack('<H', self.ratio))
+        if self.name is not None:
+            writer.writestring(self.name)
+        if self.clip_depth is not None:
+            writer.writebytes(struct.pack('<H', self.clip_depth))
+        self._encode_extra(writer)
+        if self.clip_actions is not None:
+            writer.writebytes(self.clip_actions)
+
+    def _encode_class(self, writer):
+        pass
+
+    def _encode_extra(self, writer):
+        pass
+
+class PlaceObject3(PlaceObject2):
+    code = TAG_PlaceObject3
+    fields = PlaceObject2.fields + ('class_name', 'image', 'filters',
+        'blend_mode', 'bitmap_cache', 'visible', 'background_color')
+
+    def __init__(self, depth=None, character_id=None, matrix=None, move=False,
+        class_name=None):
+        super().__init__(depth, character_id, matrix, move)
+        self.class_name = class_name
+        self.image = False
+        self.filters = None
+        self.blend_mode = None
+        self.bitmap_cache = None
+        self.visible = None
+        self.background_color = None
+
+    def _decode_flags(self, stream):
+        flags = _read_u8(stream)
+        self._flags2 = _read_u8(stream)
+        return flags
+
+    def _decode_class(self, stream, flags):
+        flags2 = self._flags2
+        self.image = bool(flags2 & 0x10)
+        if flags2 & 0x08 or (flags2 & 0x10 and flags & 0x02):
+            self.class_name = stream.readstring()
+        else:
+            self.class_name = None
+
+    def _decode_extra(self, stream):
+        flags2 = self.__dict__.pop('_flags2')
+        self.filters = _read_filters(stream) if flags2 & 0x01 else None
+        self.blend_mode = _read_u8(stream) if flags2 & 0x02 else None
+        self.bitmap_cache = _read_u8(stream) if flags2 & 0x04 else None
+        self.visible = _read_u8(stream) if flags2 & 0x20 else None
+        self.background_color = (_read_color(stream, True)
+            if flags2 & 0x40 else None)
+
+    def _encode_flags(self, writer):
+        flags2 = ((self.filters is not None)
+            | ((self.blend_mode is not None) << 1)
+            | ((self.bitmap_cache is not None) << 2)
+            | ((self.class_name is not None) << 3)
+            | (bool(self.image) << 4)
+            | ((self.visible is not None) << 5)
+            | ((self.background_color is not None) << 6))
+        writer.writebytes(bytes([self._flags(), flags2]))
+
+    def _encode_class(self, writer):
+        if self.class_name is not None:
+            writer.writestring(self.class_name)
+        elif self.image and self.character_id is not None:
+            writer.writestring('')
+
+    def _encode_extra(self, writer):
+        if self.filters is not None:
+            _write_filters(writer, self.filters)
+        if self.blend_mode is not None:
+            writer.writebytes(bytes([self.blend_mode]))
+        if self.bitmap_cache is not None:
+            writer.writebytes(bytes([self.bitmap_cache]))
+        if self.visible is not None:
+            writer.writebytes(bytes([self.visible]))
+        if self.background_color is not None:
+            writer.writebytes(bytes(self.background_color))
+
+class Gradient(object):
+    """GRADIENT or FOCALGRADIENT record, ``records`` is a list of tuples
+    ``(ratio, color)``, ``focal_point`` is raw 8.8 fixed point or None"""
+
+    def __init__(self, records=(), spread_mode=0, interpolation_mode=0,
+        focal_point=None):
+        self.spread_mode = spread_mode
+        self.interpolation_mode = interpolation_mode
+        self.records = list(records)
+        self.focal_point = focal_point
+
+    @classmethod
+    def read(cls, stream, version, focal=False):
+        self = cls()
+        stream.align()
+        self.spread_mode = stream.readbits(2)
+        self.interpolation_mode = stream.readbits(2)
+        count = stream.readbits(4)
+        for i in range(count):
+            ratio = _read_u8(stream)
+            self.records.append((ratio, _read_color(stream, version >= 3)))
+        if focal:
+            self.focal_point = struct.unpack('<h',
+                stream.readbytes(2).bytes)[0]
+        return self
+
+    def write(self, writer, version):
+        writer.align()
+        writer.writebits(2, self.spread_mode)
+        writer.writebits(2, self.interpolation_mode)
+        writer.writebits(4, len(self.records))
+        for ratio, color in self.records:
+            writer.writebytes(bytes([ratio]))
+            writer.writebytes(bytes(color))
+        if self.focal_point is not None:
+            writer.writebytes(struct.pack('<h', self.focal_point))
+
+    def __eq__(self, other):
+        return (isinstance(other, Gradient) and vars(self) == vars(other))
+
+class FillStyle(object):
+    """FILLSTYLE record. Depending on ``type`` either ``color``, or
+    ``matrix`` and ``gradient``, or ``bitmap_id`` and ``matrix`` are set"""
+    SOLID = 0x00
+    LINEAR_GRADIENT = 0x10
+    RADIAL_GRADIENT = 0x12
+    FOCAL_GRADIENT = 0x13
+    REPEATING_BITMAP = 0x40
+    CLIPPED_BITMAP = 0x41
+    NONSMOOTHED_REPEATING_BITMAP = 0x42
+    NONSMOOTHED_CLIPPED_BITMAP = 0x43
+
+    def __init__(self, type=SOLID, color=None, matrix=None, gradient=None,
+        bitmap_id=None):
+        self.type = type
+        self.color = color
+        self.matrix = matrix
+        self.gradient = gradient
+        self.bitmap_id = bitmap_id
+
+    @classmethod
+    def read(cls, stream, version):
+        self = cls(_read_u8(stream))
+        if self.type == cls.SOLID:
+            self.color = _read_color(stream, version >= 3)
+        elif self.type in (0x10, 0x12, 0x13):
+            self.matrix = Matrix.read(stream)
+            self.gradient = Gradient.read(stream, version,
+                focal=self.type == cls.FOCAL_GRADIENT)
+        elif 0x40 <= self.type <= 0x43:
+            self.bitmap_id = _read_u16(stream)
+            self.matrix = Matrix.read(stream)
+        else:
+            raise ValueError("Unknown fill style {0}".format(self.type))
+        return self
+
+    def write(self, writer, version):
+        writer.writebytes(bytes([self.type]))
+        if self.type == self.SOLID:
+            writer.writebytes(bytes(self.color))
+        elif self.bitmap_id is not None:
+            writer.writebytes(struct.pack('<H', self.bitmap_id))
+            self.matrix.write(writer)
+        else:
+            self.matrix.write(writer)
+            self.gradient.write(writer, version)
+
+    def __eq__(self, other):
+        return (isinstance(other, FillStyle) and vars(self) == vars(other))
+
+    def __repr__(self):
+        return '<FillStyle 0x{0:02x}>'.format(self.type)
+
+class LineStyle(object):
+    """LINESTYLE or LINESTYLE2 record (DefineShape4). For the latter either
+    ``color`` or ``fill`` is set"""
+
+    def __init__(self, width=20, color=(0, 0, 0, 255)):
+        self.width = width
+        self.color = color
+        self.fill = None
+        self.start_cap = 0
+        self.join = 0
+        self.no_hscale = False
+        self.no_vscale = False
+        self.pixel_hinting = False
+        self.no_close = False
+        self.end_cap = 0
+        self.miter_limit = None
+
+    @classmethod
+    def read(cls, stream, version):
+        self = cls(_read_u16(stream))
+        if version < 4:
+            self.color = _read_color(stream, version >= 3)
+            return self
+        self.start_cap = stream.readbits(2)
+        self.join = stream.readbits(2)
+        has_fill = stream.readbits(1)
+        self.no_hscale = bool(stream.readbits(1))
+        self.no_vscale = bool(stream.readbits(1))
+        self.pixel_hinting = bool(stream.readbits(1))
+        stream.readbits(5)
+        self.no_close = bool(stream.readbits(1))
+        self.end_cap = stream.readbits(2)
+        if self.join == 2:
+            self.miter_limit = _read_u16(stream)
+        if has_fill:
+            self.color = None
+            self.fill = FillStyle.read(stream, version)
+        else:
+            self.color = _read_color(stream, True)
+        return self
+
+    def write(self, writer, version):
+        writer.writebytes(struct.pack('<H', self.width))
+        if version < 4:
+            writer.writebytes(bytes(self.color))
+            return
+        writer.writebits(2, self.start_cap)
+        writer.writebits(2, self.join)
+        writer.writebits(1, self.fill is not None)
+        writer.writebits(1, self.no_hscale)
+        writer.writebits(1, self.no_vscale)
+        writer.writebits(1, self.pixel_hinting)
+        writer.writebits(5, 0)
+        writer.writebits(1, self.no_close)
+        writer.writebits(2, self.end_cap)
+        if self.join == 2:
+            writer.writebytes(struct.pack('<H', self.miter_limit or 0))
+        if self.fill is not None:
+            self.fill.write(writer, version)
+        else:
+            writer.writebytes(bytes(self.color))
+
+    def __eq__(self, other):
+        return (isinstance(other, LineStyle) and vars(self) == vars(other))
+
+def _read_styles(stream, cls, version):
+    count = _read_u8(stream)
+    if count == 0xFF and version >= 2:
+        count = _read_u16(stream)
+    return [cls.read(stream, version) for i in range(count)]
+
+def _write_styles(writer, styles, version):
+    if len(styles) >= 0xFF and version >= 2:
+        writer.writebytes(struct.pack('<BH', 0xFF, len(styles)))
+    else:
+        writer.writebytes(bytes([len(styles)]))
+    for style in styles:
+        style.write(writer, version)
+
+class StyleChange(object):
+    """STYLECHANGERECORD, fields which are not changed are None. Style
+    indexes are 1-based, zero means no style. ``new_styles`` is a tuple
+    ``(fill_styles, line_styles)`` which replaces current styles"""
+
+    def __init__(self, move=None, fill0=None, fill1=None, line=None,
+        new_styles=None):
+        self.move = move
+        self.fill0 = fill0
+        self.fill1 = fill1
+        self.line = line
+        self.new_styles = new_styles
+
+    def __eq__(self, other):
+        return (isinstance(other, StyleChange) and vars(self) == vars(other))
+
+    def __repr__(self):
+        return '<StyleChange move:{0} fill:{1}/{2} line:{3}{4}>'.format(
+            self.move, self.fill0, self.fill1, self.line,
+            ' new styles' if self.new_styles else '')
+
+class StraightEdge(object):
+    """STRAIGHTEDGERECORD, delta is in twips"""
+
+    def __init__(self, dx=0, dy=0):
+        self.dx = dx
+        self.dy = dy
+
+    def __eq__(self, other):
+        return (isinstance(other, StraightEdge)
+            and self.dx == other.dx and self.dy == other.dy)
+
+    def __repr__(self):
+        return '<StraightEdge {0} {1}>'.format(self.dx, self.dy)
+
+class CurvedEdge(object):
+    """CURVEDEDGERECORD, deltas of control and anchor points in twips"""
+
+    def __init__(self, control_dx=0, control_dy=0, anchor_dx=0, anchor_dy=0):
+        self.control_dx = control_dx
+        self.control_dy = control_dy
+        self.anchor_dx = anchor_dx
+        self.anchor_dy = anchor_dy
+
+    def __eq__(self, other):
+        return (isinstance(other, CurvedEdge) and vars(self) == vars(other))
+
+    def __repr__(self):
+        return '<CurvedEdge {0} {1} {2} {3}>'.format(self.control_dx,
+            self.control_dy, self.anchor_dx, self.anchor_dy)
+
+class Shape(object):
+    """SHAPEWITHSTYLE structure, ``version`` is the number of DefineShape
+    tag, it defines the format of styles"""
+
+    def __init__(self, fill_styles=(), line_styles=(), records=()):
+        self.fill_styles = list(fill_styles)
+        self.line_styles = list(line_styles)
+        self.records = list(records)
+
+    @classmethod
+    def read(cls, stream, version):
+        self = cls()
+        self.fill_styles = _read_styles(stream, FillStyle, version)
+        self.line_styles = _read_styles(stream, LineStyle, version)
+        fill_bits = stream.readbits(4)
+        line_bits = stream.readbits(4)
+        records = self.records
+        readbits = stream.readbits
+        readsbits = stream.readsbits
+        while True:
+            if readbits(1):
+                if readbits(1):
+                    bitlen = readbits(4) + 2
+                    if readbits(1):
+                        rec = StraightEdge(readsbits(bitlen),
+                                           readsbits(bitlen))
+                    elif readbits(1):
+                        rec = StraightEdge(0, readsbits(bitlen))
+                    else:
+                        rec = StraightEdge(readsbits(bitlen), 0)
+                else:
+                    bitlen = readbits(4) + 2
+                    rec = CurvedEdge(readsbits(bitlen), readsbits(bitlen),
+                        readsbits(bitlen), readsbits(bitlen))
+            else:
+                flags = readbits(5)
+                if not flags:
+                    break
+                rec = StyleChange()
+                if flags & 0x01:
+                    bitlen = readbits(5)
+                    rec.move = (readsbits(bitlen), readsbits(bitlen))
+                if flags & 0x02:
+                    rec.fill0 = readbits(fill_bits)
+                if flags & 0x04:
+                    rec.fill1 = readbits(fill_bits)
+                if flags & 0x08:
+                    rec.line = readbits(line_bits)
+                if flags & 0x10:
+                    rec.new_styles = (
+                        _read_styles(stream, FillStyle, version),
+                        _read_styles(stream, LineStyle, version))
+                    fill_bits = readbits(4)
+                    line_bits = readbits(4)
+            records.append(rec)
+        stream.align()
+        return self
+
+    def write(self, writer, version):
+        _write_styles(writer, self.fill_styles, version)
+        _write_styles(writer, self.line_styles, version)
+        fill_bits = io.ubits(len(self.fill_styles))
+        line_bits = io.ubits(len(self.line_styles))
+        writer.writebits(4, fill_bits)
+        writer.writebits(4, line_bits)
+        bits = writer.writebits
+        for rec in self.records:
+            if isinstance(rec, StraightEdge):
+                bitlen = max(io.sbits(rec.dx, rec.dy), 2)
+                bits(2, 0b11)
+                bits(4, bitlen - 2)
+                if rec.dx and rec.dy:
+                    bits(1, 1)
+                    bits(bitlen, rec.dx)
+                    bits(bitlen, rec.dy)
+                elif rec.dx:
+                    bits(2, 0b00)
+                    bits(bitlen, rec.dx)
+                else:
+                    bits(2, 0b01)
+                    bits(bitlen, rec.dy)
+            elif isinstance(rec, CurvedEdge):
+                values = (rec.control_dx, rec.control_dy,
+                    rec.anchor_dx, rec.anchor_dy)
+                bitlen = max(io.sbits(*values), 2)
+                bits(2, 0b10)
+                bits(4, bitlen - 2)
+                for v in values:
+                    bits(bitlen, v)
+            else:
+                bits(1, 0)
+                bits(1, rec.new_styles is not None)
+                bits(1, rec.line is not None)
+                bits(1, rec.fill1 is not None)
+                bits(1, rec.fill0 is not None)
+                bits(1, rec.move is not None)
+                if rec.move is not None:
+                    bitlen = io.sbits(*rec.move)
+                    bits(5, bitlen)
+                    bits(bitlen, rec.move[0])
+                    bits(bitlen, rec.move[1])
+                if rec.fill0 is not None:
+                    bits(fill_bits, rec.fill0)
+                if rec.fill1 is not None:
+                    bits(fill_bits, rec.fill1)
+                if rec.line is not None:
+                    bits(line_bits, rec.line)
+                if rec.new_styles is not None:
+                    fills, lines = rec.new_styles
+                    _write_styles(writer, fills, version)
+                    _write_styles(writer, lines, version)
+                    fill_bits = io.ubits(len(fills))
+                    line_bits = io.ubits(len(lines))
+                    bits(4, fill_bits)
+                    bits(4, line_bits)
+        bits(6, 0) # EndShapeRecord
+        writer.align()
+
+    def __eq__(self, other):
+        return (isinstance(other, Shape) and vars(self) == vars(other))
+
+    def __repr__(self):
+        return '<Shape fills:{0} lines:{1} records:{2}>'.format(
+            len(self.fill_styles), len(self.line_styles), len(self.records))
+
+class DefineShape(LazyTag):
+    code = TAG_DefineShape
+    version = 1
+    fields = ('shape_id', 'bounds', 'shape')
+
+    def __init__(self, shape_id=None, bounds=None, shape=None):
+        self.shape_id = shape_id
+        self.bounds = bounds
+        self.shape = shape
+
+    def _decode(self, stream):
+        self.shape_id = _read_u16(stream)
+        self.bounds = swf.Rect.read(stream)
+        self._decode_bounds(stream)
+        self.shape = Shape.read(stream, self.version)
+
+    def _decode_bounds(self, stream):
+        pass
+
+    def _encode(self, writer):
+        writer.writebytes(struct.pack('<H', self.shape_id))
+        self.bounds.write_bits(writer)
+        self._encode_bounds(writer)
+        self.shape.write(writer, self.version)
+
+    def _encode_bounds(self, writer):
+        pass
+
+class DefineShape2(DefineShape):
+    code = TAG_DefineShape2
+    version = 2
+
+class DefineShape3(DefineShape):
+    code = TAG_DefineShape3
+    version = 3
+
+class DefineShape4(DefineShape):
+    code = TAG_DefineShape4
+    version = 4
+    fields = DefineShape.fields + ('edge_bounds', 'uses_fill_winding_rule',
+        'uses_non_scaling_strokes', 'uses_scaling_strokes')
+
+    def __init__(self, shape_id=None, bounds=None, shape=None):
+        super().__init__(shape_id, bounds, shape)
+        self.edge_bounds = bounds
+        self.uses_fill_winding_rule = False
+        self.uses_non_scaling_strokes = False
+        self.uses_scaling_strokes = False
+
+    def _decode_bounds(self, stream):
+        self.edge_bounds = swf.Rect.read(stream)
+        stream.align()
+        stream.readbits(5)
+        self.uses_fill_winding_rule = bool(stream.readbits(1))
+        self.uses_non_scaling_strokes = bool(stream.readbits(1))
+        self.uses_scaling_strokes = bool(stream.readbits(1))
+
+    def _encode_bounds(self, writer):
+        self.edge_bounds.write_bits(writer)
+        writer.writebits(5, 0)
+        writer.writebits(1, self.uses_fill_winding_rule)
+        writer.writebits(1, self.uses_non_scaling_strokes)
+        writer.writebits(1, self.uses_scaling_strokes)
+
+class DefineBitsLossless(LazyTag):
+    """
+    Bitmap compressed with zlib. Compressed data is kept in ``bitmap_data``
+    and decompressed only when ``pixels`` are accessed. For ``COLORMAPPED``
+    format pixels are preceded by the color table of ``color_table_size+1``
+    entries, rows are padded to 32 bits
+    """
+    code = TAG_DefineBitsLossless
+    long_header = True
+    COLORMAPPED = 3
+    RGB15 = 4
+    RGB32 = 5
+    fields = ('character_id', 'format', 'width', 'height',
+        'color_table_size', 'bitmap_data')
+
+    def __init__(self, character_id=None, format=RGB32, width=0, height=0,
+        pixels=None, color_table_size=None):
+        self.character_id = character_id
+        self.format = format
+        self.width = width
+        self.height = height
+        self.color_table_size = color_table_size
+        self.bitmap_data = None
+        if pixels is not None:
+            self.pixels = pixels
+
+    def _decode(self, stream):
+        self.character_id, self.format, self.width, self.height = \
+            struct.unpack('<HBHH', stream.readbytes(7).bytes)
+        if self.format == self.COLORMAPPED:
+            self.color_table_size = _read_u8(stream)
+        else:
+            self.color_table_size = None
+        self.bitmap_data = stream.readrest().bytes
+
+    def _encode(self, writer):
+        writer.writebytes(struct.pack('<HBHH', self.character_id,
+            self.format, self.width, self.height))
+        if self.format == self.COLORMAPPED:
+            writer.writebytes(bytes([self.color_table_size]))
+        writer.writebytes(self.bitmap_data)
+
+    @property
+    def pixels(self):
+        return zlib.decompress(self.bitmap_data)
+
+    @pixels.setter
+    def pixels(self, value):
+        self.bitmap_data = zlib.compress(value)
+
+    def recompress(self, level=9):
+        """Compresses bitmap data again with given zlib ``level``"""
+        self.bitmap_data = zlib.compress(self.pixels, level)
+
+class DefineBitsLossless2(DefineBitsLossless):
+    """Same as DefineBitsLossless but pixels have (premultiplied) alpha"""
+    code = TAG_DefineBitsLossless2
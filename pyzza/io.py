@@ -1,5 +1,7 @@
 from io import BytesIO
+from array import array
 import struct
+import zlib
 
 s24 = 's24'
 u16 = 'u16'
@@ -14,21 +16,244 @@ class uint(int):
     def __init__(self, val):
         assert self >= 0
 
-class ABCStream(BytesIO):
+class ZlibStream(object):
+    """
+    Read-only file-like object, which decompresses data from ``file`` chunk
+    by chunk as it's read. Data which is already read is dropped from buffer
+    """
+    chunk_size = 65536
 
-    def read_formatted(self, format):
-        return getattr(self, 'read_' + format)()
+    def __init__(self, file):
+        self._file = file
+        self._zlib = zlib.decompressobj()
+        self._buf = bytearray()
+        self._pos = 0
+        self._offset = 0
 
-    def write_formatted(self, format, value):
-        return getattr(self, 'write_' + format)(value)
+    def _fill(self, size):
+        while size < 0 or len(self._buf) - self._pos < size:
+            if self._zlib.eof:
+                break
+            chunk = self._file.read(self.chunk_size)
+            if self._pos:
+                del self._buf[:self._pos]
+                self._pos = 0
+            if not chunk:
+                self._buf += self._zlib.flush()
+                break
+            self._buf += self._zlib.decompress(chunk)
+
+    def read(self, size=-1):
+        self._fill(size)
+        pos = self._pos
+        if size < 0:
+            end = len(self._buf)
+        else:
+            end = min(pos + size, len(self._buf))
+        self._pos = end
+        self._offset += end - pos
+        return bytes(self._buf[pos:end])
+
+    def tell(self):
+        return self._offset
+
+class ABCReader(object):
+    """Reads ABC data from a buffer
+
+    Keeps a memoryview of the data and a cursor, so values are decoded
+    without intermediate ``read()`` calls.
+    """
+
+    def __init__(self, data, pos=0):
+        self._data = memoryview(data)
+        self.pos = pos
+
+    @property
+    def buffer(self):
+        return self._data
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += len(self._data)
+        self.pos = pos
+        return pos
+
+    def read(self, size=-1):
+        pos = self.pos
+        if size < 0:
+            end = len(self._data)
+        else:
+            end = min(pos + size, len(self._data))
+        self.pos = end
+        return self._data[pos:end].tobytes()
+
+    def read_formatted(self, format):
+        return self._readers[format](self)
 
     def read_s24(self):
-        bytes = self.read(3)
-        res = bytes[0] | (bytes[1] << 8) | (bytes[2] << 16)
+        data = self._data
+        pos = self.pos
+        res = data[pos] | (data[pos+1] << 8) | (data[pos+2] << 16)
+        self.pos = pos + 3
         if res > (1 << 23):
             res = -((~res)&((1 << 23)-1))-1
         return res
 
+    def read_u16(self):
+        data = self._data
+        pos = self.pos
+        self.pos = pos + 2
+        return data[pos] | (data[pos+1] << 8)
+
+    def read_u8(self):
+        pos = self.pos
+        res = self._data[pos]
+        self.pos = pos + 1
+        return res
+
+    def read_u30(self):
+        data = self._data
+        pos = self.pos
+        b = data[pos]
+        if b < 128:
+            self.pos = pos + 1
+            return b
+        res = b & 127
+        for shift in (7, 14, 21, 28):
+            pos += 1
+            b = data[pos]
+            res |= (b & 127) << shift
+            if b < 128:
+                break
+        self.pos = pos + 1
+        assert res < (1 << 30)
+        return res
+
+    def read_u30_array(self, count):
+        """Reads ``count`` consecutive u30 values"""
+        data = self._data
+        pos = self.pos
+        res = []
+        append = res.append
+        for i in range(count):
+            b = data[pos]
+            pos += 1
+            if b < 128:
+                append(b)
+                continue
+            val = b & 127
+            for shift in (7, 14, 21, 28):
+                b = data[pos]
+                pos += 1
+                val |= (b & 127) << shift
+                if b < 128:
+                    break
+            assert val < (1 << 30)
+            append(val)
+        self.pos = pos
+        return res
+
+    def read_s32(self):
+        return self.read_s32_array(1)[0]
+
+    def read_s32_array(self, count):
+        """Reads ``count`` consecutive s32 values"""
+        data = self._data
+        pos = self.pos
+        res = []
+        append = res.append
+        for i in range(count):
+            val = 0
+            for shift in (0, 7, 14, 21, 28):
+                b = data[pos]
+                pos += 1
+                if b & 128:
+                    val |= (b & 127) << shift
+                else:
+                    val |= (b & 63) << shift
+                    if b & 64:
+                        val = -val
+                    break
+            assert -(1 << 32) < val < (1 << 32)
+            append(val)
+        self.pos = pos
+        return res
+
+    def read_u32(self):
+        return self.read_u32_array(1)[0]
+
+    def read_u32_array(self, count):
+        """Reads ``count`` consecutive u32 values as ``uint`` instances"""
+        data = self._data
+        pos = self.pos
+        res = []
+        append = res.append
+        for i in range(count):
+            val = 0
+            for shift in (0, 7, 14, 21, 28):
+                b = data[pos]
+                pos += 1
+                val |= (b & 127) << shift
+                if b < 128:
+                    break
+            assert val < (1 << 32)
+            append(uint(val))
+        self.pos = pos
+        return res
+
+    def read_string_bounds(self, count):
+        """Skips ``count`` length-prefixed strings, returns array of
+        ``start, end`` offsets of each string in the buffer"""
+        data = self._data
+        pos = self.pos
+        res = array('L')
+        append = res.append
+        for i in range(count):
+            size = data[pos]
+            pos += 1
+            if size >= 128:
+                self.pos = pos - 1
+                size = self.read_u30()
+                pos = self.pos
+            append(pos)
+            pos += size
+            append(pos)
+        if pos > len(data):
+            raise IndexError("string is out of buffer")
+        self.pos = pos
+        return res
+
+    def read_d64(self):
+        pos = self.pos
+        self.pos = pos + 8
+        return struct.unpack_from('<d', self._data, pos)[0]
+
+    def read_d64_array(self, count):
+        """Reads ``count`` consecutive doubles"""
+        pos = self.pos
+        self.pos = pos + 8*count
+        return list(struct.unpack_from('<{0}d'.format(count), self._data, pos))
+
+ABCReader._readers = {
+    s24: ABCReader.read_s24,
+    u16: ABCReader.read_u16,
+    u8: ABCReader.read_u8,
+    u30: ABCReader.read_u30,
+    s32: ABCReader.read_s32,
+    u32: ABCReader.read_u32,
+    d64: ABCReader.read_d64,
+    }
+
+class ABCStream(BytesIO):
+
+    def write_formatted(self, format, value):
+        return getattr(self, 'write_' + format)(value)
+
     def write_s24(self, val):
         assert -(1 << 23) < val < (1 << 23)
         if val < 0:
@@ -37,33 +262,16 @@ class ABCStream(BytesIO):
             ((val >> 8) & 0xFF),
             val >> 16]))
 
-    def read_u16(self):
-        bytes = self.read(2)
-        return uint(bytes[0] | (bytes[1] << 8))
-
     def write_u16(self, val):
         assert 0 <= val < 1 << 16
         self.write(bytes([
             val & 0xFF,
             val >> 8]))
 
-    def read_u8(self):
-        return uint(self.read(1)[0])
-
     def write_u8(self, val):
         assert 0 <= val < 256
         self.write(bytes([ val ]))
 
-    def read_u30(self):
-        res = 0
-        for i in range(5):
-            b = self.read(1)
-            res |= (b[0] & 127) << (i*7)
-            if not (b[0] & 128):
-                break
-        assert res < (1 << 30)
-        return uint(res)
-
     def write_u30(self, val):
         assert val < (1 << 30)
         while True:
@@ -75,20 +283,6 @@ class ABCStream(BytesIO):
             if not val:
                 break
 
-    def read_s32(self):
-        res = 0
-        for i in range(5):
-            b = self.read(1)
-            if b[0] & 128:
-                res |= (b[0] & 127) << (i*7)
-            else:
-                res |= (b[0] & 63) << (i*7)
-                if b[0] & 64:
-                    res = -res
-                break
-        assert -(1 << 32) < res < (1 << 32)
-        return res
-
     def write_s32(self, val):
         if val < 0:
             sign = 64
@@ -109,16 +303,6 @@ class ABCStream(BytesIO):
             if not (byte & 128):
                 break
 
-    def read_u32(self):
-        res = 0
-        for i in range(5):
-            b = self.read(1)
-            res |= (b[0] & 127) << (i*7)
-            if not (b[0] & 128):
-                break
-        assert res < (1 << 32)
-        return uint(res)
-
     def write_u32(self, val):
         assert 0 <= val < (1 << 32)
         while val:
@@ -128,9 +312,6 @@ class ABCStream(BytesIO):
                 byte |= 128
             self.write(bytes([byte]))
 
-    def read_d64(self):
-        return struct.unpack('d', self.read(8))[0]
-
     def write_d64(self, val):
         self.write(struct.pack('d', val))
 
@@ -146,17 +327,12 @@ class Bytes(object):
 
     @property
     def int_be(self):
-        res = 0
-        for i in self._bytes:
-            res = (res << 8) | i
-        return res
+        return int.from_bytes(self._bytes, 'big')
 
     @property
     def int_le(self):
-        res = 0
-        for i in reversed(self._bytes):
-            res = (res << 8) | i
-        return res
+        return int.from_bytes(self._bytes, 'little')
+
     @property
     def sint_le(self):
         res = 0
@@ -173,49 +349,124 @@ class Bytes(object):
         return self._bytes
 
 class BitStream(object):
+    """
+    Reads bits and bytes from the preloaded buffer. Bits are taken from the
+    accumulator, which is refilled by 8 bytes at once. Reading bytes or
+    strings skips to the next byte boundary
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self._acc = 0
+        self._bits = 0
 
-    def __init__(self, stream):
-        self._stream = stream
-        self._buf = b''
-        self._bitoffset = 0
+    def _align(self):
+        # return whole bytes left in accumulator to the buffer
+        self._pos -= self._bits >> 3
+        self._acc = 0
+        self._bits = 0
 
     def readbytes(self, count):
-        if self._buf:
-            self._buf = b''
-            self._bitoffset = 0
-        return Bytes(self._stream.read(count))
+        if self._bits:
+            self._align()
+        pos = self._pos
+        self._pos = pos + count
+        return Bytes(self._data[pos:pos+count])
 
     def readstring(self):
-        c = self._stream.read(1)
-        res = bytearray()
-        while c and c != b'\x00':
-            res.extend(c)
-            c = self._stream.read(1)
-        return res.decode('utf-8')
+        if self._bits:
+            self._align()
+        pos = self._pos
+        end = self._data.find(b'\x00', pos)
+        if end < 0:
+            end = len(self._data)
+        self._pos = end + 1
+        return str(self._data[pos:end], 'utf-8')
 
     def readbits(self, count):
-        if self._buf:
-            if self._bitoffset + count >= 8:
-                val = ((1 << (8 - self._bitoffset)) - 1) & self._buf[0]
-                count -= 8 - self._bitoffset
-                self._buf = b''
-                self._bitoffset = 0
-            else:
-                val = ((1 << count)-1) & (self._buf[0] >> (8
-                    - self._bitoffset - count))
-                self._bitoffset += count
-                return val
-        else:
-            val = 0
-        bytes = count >> 3
-        for i in range(bytes):
-            byt = self._stream.read(1)
-            val = (val << 8) | byt[0]
-        tail = count & 7
-        if tail:
-            self._buf = self._stream.read(1)
-            val <<= tail
-            val |= self._buf[0] >> (8 - tail)
-            self._bitoffset = tail
+        bits = self._bits
+        acc = self._acc
+        while bits < count:
+            chunk = self._data[self._pos:self._pos+8]
+            if not chunk:
+                raise EOFError("Not enough data to read {0} bits"
+                    .format(count))
+            self._pos += len(chunk)
+            acc = (acc << (len(chunk) << 3)) | int.from_bytes(chunk, 'big')
+            bits += len(chunk) << 3
+        bits -= count
+        self._bits = bits
+        self._acc = acc & ((1 << bits) - 1)
+        return acc >> bits
+
+    def readsbits(self, count):
+        """Reads signed (two's complement) value of ``count`` bits"""
+        val = self.readbits(count)
+        if count and val >> (count - 1):
+            val -= 1 << count
         return val
 
+    def readrest(self):
+        """Reads all bytes left in the buffer"""
+        if self._bits:
+            self._align()
+        pos = self._pos
+        self._pos = len(self._data)
+        return Bytes(self._data[pos:])
+
+    def align(self):
+        """Skips to the next byte boundary"""
+        if self._bits:
+            self._align()
+
+class BitWriter(object):
+    """
+    Writes bits and bytes into the buffer, counterpart of BitStream. Writing
+    bytes or strings pads current byte with zero bits
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def writebits(self, count, value):
+        acc = (self._acc << count) | (value & ((1 << count) - 1))
+        bits = self._bits + count
+        while bits >= 8:
+            bits -= 8
+            self._buf.append((acc >> bits) & 0xFF)
+        self._bits = bits
+        self._acc = acc & ((1 << bits) - 1)
+
+    # negative values are cut to ``count`` bits of two's complement
+    writesbits = writebits
+
+    def align(self):
+        if self._bits:
+            self._buf.append((self._acc << (8 - self._bits)) & 0xFF)
+            self._acc = 0
+            self._bits = 0
+
+    def writebytes(self, data):
+        self.align()
+        self._buf += data
+
+    def writestring(self, value):
+        self.writebytes(value.encode('utf-8'))
+        self._buf.append(0)
+
+    def getvalue(self):
+        self.align()
+        return bytes(self._buf)
+
+def ubits(*values):
+    """Returns number of bits needed to store unsigned ``values``"""
+    return max(v.bit_length() for v in values)
+
+def sbits(*values):
+    """Returns number of bits needed to store signed ``values``, zero if all
+    values are zero"""
+    res = max((v if v >= 0 else ~v).bit_length() for v in values)
+    return res + 1 if res or any(values) else 0
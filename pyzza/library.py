@@ -1,10 +1,32 @@
 from weakref import ref
+import os
 import os.path
 import zipfile
+import pickle
+import hashlib
+import tempfile
+import warnings
 from contextlib import closing
 import itertools
 
-from . import swf, tags, abc, bytecode
+from . import swf, tags, abc, bytecode, io
+
+def _sources_hash():
+    """Hash of the modules which define structures pickled into the library
+    cache, so that cache written by another version of pyzza is not used"""
+    res = hashlib.sha1()
+    for filename in (abc.__file__, bytecode.__file__, io.__file__,
+        tags.__file__, swf.__file__, __file__):
+        with open(filename, 'rb') as f:
+            res.update(f.read())
+    return res.hexdigest()
+
+# version of the on-disk library cache format, part of the cache key
+CACHE_VERSION = _sources_hash()
+# directory for parsed libraries, empty string or None disables the cache
+cache_dir = os.environ.get('PYZZA_CACHE_DIR',
+    os.path.join(os.environ.get('XDG_CACHE_HOME',
+        os.path.join(os.path.expanduser('~'), '.cache')), 'pyzza'))
 
 class PropertyNotFoundError(Exception):
     pass
@@ -16,14 +38,96 @@ def get_public_names(filename):
     lib.add_file(filename)
     return lib.get_public_names()
 
+class PickledList(abc.LazyList):
+    """
+    List of structures each of which is pickled separately and is unpickled
+    only on first access. Used to store classes in the library cache
+    """
+
+    def __init__(self, items):
+        self._items = list(items)
+        self._blobs = [pickle.dumps(i, pickle.HIGHEST_PROTOCOL)
+            for i in self._items]
+
+    def _decode(self, index):
+        return pickle.loads(self._blobs[index])
+
+    def __getstate__(self):
+        return self._blobs
+
+    def __setstate__(self, blobs):
+        self._blobs = blobs
+        self._items = [abc.nothing]*len(blobs)
+
 class LibCache:
+    """
+    Parsed library file. Use ``LibCache.load(filename)`` which returns instance
+    from memory or from the disk cache (see ``cache_dir``) if the file is not
+    changed since it was parsed.
+
+    Code headers in the cache are compacted: they contain only ``_names``,
+    ``_classes`` indexes and classes (with their traits, methods and
+    metadata), each class is pickled separately and is unpickled when
+    accessed. All other parts of ABC file are dropped.
+    """
     files = {}
-    def __new__(C, filename):
-        if filename in C.files:
-            res = C.files[filename]
-            if res.mtime == os.path.getmtime(filename):
-                return
-        return object.__new__(C)
+
+    @classmethod
+    def load(C, filename):
+        filename = os.path.realpath(filename)
+        stat = os.stat(filename)
+        key = (filename, stat.st_mtime, stat.st_size, CACHE_VERSION)
+        res = C.files.get(filename)
+        if res is not None and res.key == key:
+            return res
+        res = C._load_cached(key)
+        if res is None:
+            res = C(filename)
+            res.key = key
+            res._save_cached()
+        C.files[filename] = res
+        return res
+
+    @staticmethod
+    def _cache_file(key):
+        return os.path.join(cache_dir, hashlib.sha1(
+            key[0].encode('utf-8')).hexdigest() + '.libcache')
+
+    @classmethod
+    def _load_cached(C, key):
+        if not cache_dir:
+            return None
+        try:
+            with open(C._cache_file(key), 'rb') as f:
+                res = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            warnings.warn("Can't read library cache for {0!r}: {1}"
+                .format(key[0], e))
+            return None
+        if not isinstance(res, C) or res.key != key:
+            return None
+        return res
+
+    def _save_cached(self):
+        if not cache_dir:
+            return
+        fn = self._cache_file(self.key)
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmpname, fn)
+            except:
+                os.unlink(tmpname)
+                raise
+        except (IOError, OSError, pickle.PicklingError) as e:
+            warnings.warn("Can't write library cache for {0!r}: {1}"
+                .format(self.key[0], e))
 
     def __init__(self, filename):
         self.code_headers = []
@@ -34,32 +138,36 @@ class LibCache:
                     with closing(zip.open(finfo.filename)) as ff:
                         self._read(ff, filename + ':' + finfo.filename)
         else:
-            with open(filename, 'rb') as f:
-                self._read(f, filename)
+            self._read(filename, filename)
 
 
     def _read(self, file, filename):
         h = swf.Header.read(file)
-        tag = None
-        taglist = []
-        while not isinstance(tag, tags.End):
-            tag = tags.read(h.file)
-            if isinstance(tag, tags.DoABC):
-                tag.real_body._source = filename
-                names = {}
-                for t in tag.real_body.script_info[-1].traits_info:
-                    nm = t.name
-                    if isinstance(nm.namespace, abc.NSPackage):
-                        if isinstance(t.data, abc.TraitClass):
-                            names[nm.namespace.name, nm.name] = 'class'
-                        elif isinstance(t.data, abc.TraitMethod):
-                            names[nm.namespace.name, nm.name] = 'function'
-                for t in tag.real_body.class_info:
-                    nm = t.instance_info.name
-                    if isinstance(nm.namespace, abc.NSPackage):
+        for (code, body, tag) in h.iter_tags((tags.TAG_DoABC,), lazy=True):
+            if tag is None:
+                continue
+            names = {}
+            for (nm, kind) in tag.real_body.get_script_traits(-1):
+                if isinstance(nm.namespace, abc.NSPackage):
+                    if kind == abc.TraitClass.kind:
                         names[nm.namespace.name, nm.name] = 'class'
-                tag.real_body._names = names
-                self.code_headers.append(tag.real_body)
+                    elif kind in (1, 2, 3): # method, getter, setter
+                        names[nm.namespace.name, nm.name] = 'function'
+            classes = {}
+            for (idx, nm) in enumerate(tag.real_body.get_class_names()):
+                if isinstance(nm.namespace, abc.NSPackage):
+                    names[nm.namespace.name, nm.name] = 'class'
+                    classes.setdefault((nm.namespace.name, nm.name), idx)
+            self.code_headers.append(self._compact(tag.real_body,
+                filename, names, classes))
+
+    def _compact(self, head, filename, names, classes):
+        res = abc.ABCFile()
+        res.class_info = PickledList(head.class_info)
+        res._source = filename
+        res._names = names
+        res._classes = classes
+        return res
 
 
 class Library:
@@ -83,7 +191,7 @@ class Library:
         return res
 
     def add_file(self, filename):
-        self.code_headers.extend(LibCache(filename).code_headers)
+        self.code_headers.extend(LibCache.load(filename).code_headers)
 
     def get_property_type(self, package, name):
         for head in itertools.chain((self,), self.code_headers):
@@ -107,17 +215,16 @@ class Library:
         if (package, name) in self.class_cache:
             return self.class_cache[package, name]
         for head in self.code_headers:
-            if (package, name) in head._names:
-                for (idx, cls) in enumerate(head.class_info):
-                    qname = cls.instance_info.name
-                    if name == qname.name and qname.namespace.name == package:
-                        res = AS3Class(qname, self,
-                            class_info=cls,
-                            index=idx,
-                            header=head,
-                            )
-                        self.class_cache[package, name] = res
-                        return res
+            if (package, name) in head._classes:
+                idx = head._classes[package, name]
+                cls = head.class_info[idx]
+                res = AS3Class(cls.instance_info.name, self,
+                    class_info=cls,
+                    index=idx,
+                    header=head,
+                    )
+                self.class_cache[package, name] = res
+                return res
         else:
             raise ClassNotFoundError(package, name)
 
@@ -1,11 +1,20 @@
 import zlib
+import mmap
 import struct
 from io import BytesIO
-from math import log, ceil
 from operator import methodcaller
+from itertools import chain
 
 from . import io, tags
 
+# zlib compression levels by name, None means uncompressed (FWS) file
+COMPRESSION = {
+    'none': None,
+    'fast': 1,
+    'default': zlib.Z_DEFAULT_COMPRESSION,
+    'max': 9,
+    }
+
 class Rect(object):
     x_min = None
     x_max = None
@@ -21,31 +30,27 @@ class Rect(object):
     @classmethod
     def read(cls, bitstr):
         self = cls()
+        bitstr.align()
         bitlen = bitstr.readbits(5)
-        self.x_min = bitstr.readbits(bitlen)
-        self.x_max = bitstr.readbits(bitlen)
-        self.y_min = bitstr.readbits(bitlen)
-        self.y_max = bitstr.readbits(bitlen)
+        self.x_min = bitstr.readsbits(bitlen)
+        self.x_max = bitstr.readsbits(bitlen)
+        self.y_min = bitstr.readsbits(bitlen)
+        self.y_max = bitstr.readsbits(bitlen)
         return self
 
+    def write_bits(self, writer):
+        values = (self.x_min, self.x_max, self.y_min, self.y_max)
+        bitlen = io.sbits(*values)
+        writer.align()
+        writer.writebits(5, bitlen)
+        for v in values:
+            writer.writesbits(bitlen, v)
+        writer.align()
+
     def write(self, file):
-        lg2 = log(2)
-        bitlen = int(max(len(bin(int(getattr(self, a))))-1
-            for a in ('x_min', 'x_max', 'y_min', 'y_max')))
-        res = bitlen
-        res <<= bitlen
-        res |= self.x_min
-        res <<= bitlen
-        res |= self.x_max
-        res <<= bitlen
-        res |= self.y_min
-        res <<= bitlen
-        res |= self.y_max
-        bytelen = int(ceil((5 + bitlen*4)/8.))
-        res <<= bytelen*8 - (bitlen*4 + 5)
-        val = bytes(reversed([(res >> (i*8))&0xFF
-            for i in range(bytelen)]))
-        file.write(val)
+        writer = io.BitWriter()
+        self.write_bits(writer)
+        file.write(writer.getvalue())
 
     def __repr__(self):
         return "<RECT {x_min} {x_max} {y_min} {y_max}>".format(**self.__dict__)
@@ -58,6 +63,7 @@ class Header(object):
     frame_size = None
     frame_rate = None
     frame_count = None
+    source = None # file opened by ``read``, closed when tags are read
 
     def __init__(self, compressed=True, version=10, frame_size=(10000,7500),
         frame_rate=(15<<8), frame_count=1):
@@ -69,32 +75,83 @@ class Header(object):
 
     @classmethod
     def read(cls, file):
-        stream = io.BitStream(file)
+        """Reads header from the file object or from the file with given path.
+        Uncompressed file given by path is memory mapped, so tags are read
+        directly from mapped pages, other files are kept open until all tags
+        are iterated over or ``close()`` is called"""
+        if isinstance(file, str):
+            f = open(file, 'rb')
+            if f.read(3) != b'FWS':
+                f.seek(0)
+                try:
+                    self = cls.read(f)
+                except:
+                    f.close()
+                    raise
+                self.source = f
+                return self
+            with f:
+                file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls.read(file)
         self = cls()
-        sig = stream.readbytes(3).bytes
+        sig, self.version, self.file_length = struct.unpack('<3sBL',
+            file.read(8))
         if sig == b'FWS':
             self.compressed = False
         elif sig == b'CWS':
             self.compressed = True
         else:
             raise ValueError("Wrong signature ``{0}''".format(sig))
-        self.version = stream.readbytes(1).int_le
-        self.file_length = stream.readbytes(4).int_le
         if self.compressed:
-            buf = zlib.decompress(file.read())
-            assert len(buf)+8 == self.file_length,\
-                '{0} {1}'.format(len(buf), self.file_length)
-            self.file = BytesIO(buf)
-            stream = io.BitStream(self.file)
+            self.file = io.ZlibStream(file)
         else:
             self.file = file
+        # rect is 5 bits of field size and four fields, then two u16 follow
+        data = self.file.read(1)
+        nbits = 5 + (data[0] >> 3)*4
+        data += self.file.read(((nbits + 7) >> 3) - 1 + 4)
+        stream = io.BitStream(data)
         self.frame_size = Rect.read(stream)
         self.frame_rate = stream.readbytes(2).int_le
         self.frame_count = stream.readbytes(2).int_le
-        self.stream = stream
         return self
 
-    def write_swf(self, file, content):
+    def iter_tags(self, codes=None, lazy=False):
+        """Iterates over tags following the header, see ``tags.iterate``.
+        Compressed files are decompressed as tags are read"""
+        if isinstance(self.file, BytesIO):
+            data = self.file.getbuffer()[self.file.tell():]
+        elif isinstance(self.file, mmap.mmap):
+            data = memoryview(self.file)[self.file.tell():]
+        else:
+            return self._iter_file(codes, lazy)
+        return tags.iterate(data, codes, lazy)
+
+    def _iter_file(self, codes, lazy):
+        try:
+            for item in tags.iterate_file(self.file, codes, lazy):
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Closes the file opened by ``read``, if any"""
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def write_swf(self, file, content, compression='default'):
+        """Writes file with ``content`` (bytes or list of buffers, e.g. from
+        ``Tag.buffers()``) following the header. ``compression`` is one of
+        ``COMPRESSION`` keys, buffers are compressed one by one as they are
+        written"""
+        try:
+            level = COMPRESSION[compression]
+        except KeyError:
+            raise ValueError("Wrong compression {0!r}, use one of {1}".format(
+                compression, ', '.join(sorted(COMPRESSION))))
+        if isinstance(content, (bytes, bytearray)):
+            content = [content]
         b = BytesIO()
         self.frame_size.write(b)
         b.write(bytes([
@@ -105,10 +162,10 @@ class Header(object):
             self.frame_count & 0xFF,
             (self.frame_count >> 8) & 0xFF,
             ]))
-        content = b.getvalue() + content
-        zcont = zlib.compress(content)
-        self.file_length = len(content) + 8
-        file.write(b'CWS')
+        head = b.getvalue()
+        self.compressed = level is not None
+        self.file_length = len(head) + sum(map(len, content)) + 8
+        file.write(b'CWS' if self.compressed else b'FWS')
         file.write(bytes([
             self.version,
             self.file_length & 0xFF,
@@ -116,7 +173,15 @@ class Header(object):
             (self.file_length >> 16) & 0xFF,
             (self.file_length >> 24) & 0xFF,
             ]))
-        file.write(zcont)
+        if self.compressed:
+            z = zlib.compressobj(level)
+            file.write(z.compress(head))
+            for buf in content:
+                file.write(z.compress(buf))
+            file.write(z.flush())
+        else:
+            file.write(head)
+            file.writelines(content)
 
     def __repr__(self):
         return "<Header z:{0} ver:{version} len:{file_length} "\
@@ -145,8 +210,33 @@ def get_options():
     op.add_option('-o', '--output', metavar="FILE",
         help='Write output swf into FILE',
         dest="output", default=None, type="string")
+    op.add_option('-z', '--compression', metavar="LEVEL",
+        help="Compression of output swf: `none` (uncompressed), `fast`, "
+            "`default` or `max`",
+        dest="compression", default="default", type="choice",
+        choices=tuple(COMPRESSION))
+    op.add_option('-D', '--dedup',
+        help='Merge define tags (bitmaps, shapes, sprites, binary data) with'
+            ' same contents into one and print number of bytes saved',
+        dest="dedup", default=False, action="store_true")
+    op.add_option('-S', '--size-report',
+        help='Print sizes of constant pool sections and whole tag for each'
+            ' DoABC tag',
+        dest="size_report", default=False, action="store_true")
     return op
 
+def print_size_report(tag):
+    """Prints sizes of constant pool sections of DoABC tag which was read or
+    written"""
+    print("DoABC {0!r}".format(tag.name))
+    for (name, count, size) in tag.real_body.sizes():
+        if count is None:
+            print("    {0:16s} {1:8d} bytes".format(name, size))
+        else:
+            print("    {0:16s} {1:8d} bytes, {2} entries".format(
+                name, size, count))
+    print("    {0:16s} {1:8d} bytes".format('total', tag.length))
+
 def main():
     global options
     op = get_options()
@@ -155,22 +245,27 @@ def main():
     if len(args) != 1:
         op.error("Exacly one argument expected")
 
-    with open(args[0], 'rb') as f:
-        h = Header.read(f)
+    h = Header.read(args[0])
+    if options.print_tags:
+        print(h)
+    if options.print_tags or options.output:
+        codes = None
+    else:
+        codes = (tags.TAG_DoABC,)
+    taglist = []
+    for (code, body, tag) in h.iter_tags(codes):
+        if tag is None:
+            continue
+        taglist.append(tag)
         if options.print_tags:
-            print(h)
-        tag = None
-        taglist = []
-        while not isinstance(tag, tags.End):
-            tag = tags.read(h.file)
-            taglist.append(tag)
-            if options.print_tags:
-                print(tag)
-            if options.print_abcfile and isinstance(tag, tags.DoABC):
-                from . import pretty
-                pretty.pprint(tag.real_body)
-            if options.print_dis and hasattr(tag, 'disassemble'):
-                tag.disassemble()
+            print(tag)
+        if options.print_abcfile and isinstance(tag, tags.DoABC):
+            from . import pretty
+            pretty.pprint(tag.real_body)
+        if options.print_dis and hasattr(tag, 'disassemble'):
+            tag.disassemble()
+        if options.size_report and isinstance(tag, tags.DoABC):
+            print_size_report(tag)
 
     if options.output:
         if options.optimize:
@@ -187,9 +282,14 @@ def main():
                 tags.FileAttributes,
                 )
             taglist = (tag for tag in taglist if isinstance(tag, good_tags))
-        content = b''.join(map(methodcaller('blob'), taglist))
+        if options.dedup:
+            from . import dedup
+            taglist, saved = dedup.dedup(taglist)
+            print("Deduplication saved {0} bytes".format(saved))
+        content = list(chain.from_iterable(
+            map(methodcaller('buffers'), taglist)))
         with open(options.output, 'wb') as outfile:
-            h.write_swf(outfile, content)
+            h.write_swf(outfile, content, compression=options.compression)
 
 if __name__ == '__main__':
 
@@ -1,12 +1,20 @@
+import struct
+
 from . import io
 
 TAG_ShowFrame = 1
+TAG_DefineShape = 2
 TAG_PlaceObject = 4
 TAG_RemoveObject = 5
 TAG_SetBackgroundColor = 9
+TAG_DefineBitsLossless = 20
+TAG_DefineShape2 = 22
 TAG_Protect = 24
 TAG_RemoveObject2 = 28
 TAG_PlaceObject2 = 26
+TAG_DefineShape3 = 32
+TAG_DefineBitsLossless2 = 36
+TAG_DefineSprite = 39
 TAG_FrameLabel = 43
 TAG_ExportAssets = 56
 TAG_ImportAssets = 57
@@ -22,30 +30,29 @@ TAG_Metadata = 77
 TAG_DefineScalingGrid = 78
 TAG_DefineSceneAndFrameLabelData = 86
 TAG_DoABC = 82
+TAG_DefineShape4 = 83
+TAG_DefineBinaryData = 87
 TAG_End = 0
 
 class Tag(object):
     code = None
     length = None
+    long_header = False # some tags must have long header whatever the length
+
+    def header(self):
+        """Returns encoded header of the tag with current ``length``"""
+        if self.length > 62 or self.long_header:
+            return struct.pack('<HL', (self.code << 6) | 0x3f, self.length)
+        return struct.pack('<H', (self.code << 6) | self.length)
+
+    def buffers(self):
+        """Returns list of buffers (header and data) that make up the tag, so
+        that they can be written without joining"""
+        self.length = len(self.data)
+        return [self.header(), self.data]
 
     def blob(self):
-        res = bytearray()
-        if self.length > 62:
-            res += bytes([
-                ((self.code << 6) | 0x3f) & 0xFF,
-                (self.code << 6) >> 8])
-            res += bytes([
-                self.length & 0xFF,
-                (self.length >> 8) & 0xFF,
-                (self.length >> 16) & 0xFF,
-                (self.length >> 24) & 0xFF,
-                ])
-        else:
-            res += bytes([
-                ((self.code & 0x3) << 6) | self.length,
-                self.code >> 2])
-        res += self.data
-        return res
+        return b''.join(self.buffers())
 
     def _read(self, stream):
         self.data = stream.readbytes(self.length).bytes
@@ -57,9 +64,9 @@ class Tag(object):
 class End(Tag):
     code = TAG_End
 
-    def blob(self):
+    def buffers(self):
         self.data = b''
-        return super().blob()
+        return super().buffers()
 
     def _read(self, stream):
         assert self.length == 0, self.length
@@ -68,25 +75,27 @@ class SymbolClass(Tag):
     code = TAG_SymbolClass
 
     def __init__(self, main_class=None):
+        # pairs of character id and class name, several classes may be bound
+        # to the same character
+        self.assoc = []
         if main_class is not None:
-            self.assoc = { 0: main_class }
+            self.assoc.append((0, main_class))
 
     def _read(self, stream):
         self.number = stream.readbytes(2).int_le
-        self.assoc = {}
+        self.assoc = []
         for i in range(self.number):
             k = stream.readbytes(2).int_le
-            self.assoc[k] = stream.readstring()
+            self.assoc.append((k, stream.readstring()))
 
-    def blob(self):
+    def buffers(self):
         self.number = len(self.assoc)
         self.data = bytearray([self.number & 0xFF, self.number >> 8])
-        for (k, v) in self.assoc.items():
-            self.data.extend([k >> 8, k & 0xFF])
+        for (k, v) in self.assoc:
+            self.data.extend([k & 0xFF, k >> 8])
             self.data.extend(v.encode('utf-8'))
             self.data.append(0)
-        self.length = len(self.data)
-        return super().blob()
+        return super().buffers()
 
     def __repr__(self):
         return '<{0} {1!r}>'.format(self.__class__.__name__, self.assoc)
@@ -114,7 +123,7 @@ class FileAttributes(Tag):
         self.UseNetwork = bool(stream.readbits(1))
         self.r3 = stream.readbits(24)
 
-    def blob(self):
+    def buffers(self):
         self.HasMetadata = False
         byte = ((self.r1 << 7)
             | (int(self.UseDirectBlit) << 6)
@@ -129,18 +138,19 @@ class FileAttributes(Tag):
             (self.r3 >> 8) & 0xFF,
             (self.r3 >> 16) & 0xFF,
             ])
-        self.length = len(self.data)
-        return super().blob()
+        return super().buffers()
 
 class ShowFrame(Tag):
     code = TAG_ShowFrame
 
-    def blob(self):
-        self.length = 0
+    def buffers(self):
         self.data = b''
-        return super().blob()
+        return super().buffers()
 
 from .abc import DoABC
+from .graphics import (PlaceObject2, PlaceObject3,
+    DefineShape, DefineShape2, DefineShape3, DefineShape4,
+    DefineBitsLossless, DefineBitsLossless2)
 
 tag_classes = {}
 for v in list(globals().values()):
@@ -148,17 +158,78 @@ for v in list(globals().values()):
         tag_classes[v.code] = v
 del v
 
-def read(file):
-    stream = io.BitStream(file)
-    mark = stream.readbytes(2).int_le
-    code = mark >> 6
-    if code in tag_classes:
-        self = tag_classes[code]()
-    else:
-        self = Tag()
+def _make(code, body, lazy):
+    cls = tag_classes.get(code, Tag)
+    self = cls()
+    if lazy and isinstance(self, DoABC):
+        self.lazy = True
     self.code = code
-    self.length = mark & 63
-    if self.length == 0x3f:
-        self.length = stream.readbytes(4).int_le
-    self._read(stream)
+    self.length = len(body)
+    self._read(io.BitStream(body))
     return self
+
+def read_header(data, pos=0):
+    """Decodes tag header at ``pos`` of the buffer ``data``. Returns tuple
+    ``(code, length, body_pos)``. End of data is treated as End tag"""
+    if pos + 2 > len(data):
+        return TAG_End, 0, len(data)
+    mark = struct.unpack_from('<H', data, pos)[0]
+    length = mark & 63
+    if length == 0x3f:
+        return mark >> 6, struct.unpack_from('<L', data, pos+2)[0], pos+6
+    return mark >> 6, length, pos+2
+
+def iterate(data, codes=None, lazy=False):
+    """Iterates over tags in the buffer ``data`` up to End tag. Yields tuples
+    ``(code, body, tag)`` where ``body`` is a memoryview of tag data (no copy
+    is made). Tag is decoded (and gets its own copy of data) only if ``codes``
+    is None or contains its code, otherwise ``tag`` is None"""
+    data = memoryview(data)
+    pos = 0
+    while True:
+        code, length, pos = read_header(data, pos)
+        body = data[pos:pos+length]
+        pos += length
+        if codes is None or code in codes:
+            tag = _make(code, body.tobytes(), lazy)
+        else:
+            tag = None
+        yield code, body, tag
+        if code == TAG_End:
+            break
+
+def iterate_file(file, codes=None, lazy=False, chunk_size=65536):
+    """Same as ``iterate`` but reads the file by chunks of ``chunk_size``
+    bytes, so only current chunk and tag are kept in memory"""
+    buf = memoryview(b'')
+    pos = 0
+    while True:
+        if len(buf) - pos < 6:
+            buf = memoryview(buf[pos:].tobytes() + file.read(chunk_size))
+            pos = 0
+        code, length, pos = read_header(buf, pos)
+        end = pos + length
+        if end > len(buf):
+            buf = memoryview(buf[pos:].tobytes()
+                + file.read(max(end - len(buf), chunk_size)))
+            pos, end = 0, length
+        body = buf[pos:end]
+        pos = end
+        if codes is None or code in codes:
+            tag = _make(code, body.tobytes(), lazy)
+        else:
+            tag = None
+        yield code, body, tag
+        if code == TAG_End:
+            break
+
+def read(file, lazy=False):
+    """Reads single tag from the file. If ``lazy`` is True, DoABC tags decode
+    only those parts of ABC file which are accessed (useful for libraries)"""
+    head = file.read(2)
+    if len(head) < 2: # end of file is treated as End tag
+        return _make(TAG_End, b'', lazy)
+    if head[0] & 0x3f == 0x3f: # long header
+        head += file.read(4)
+    code, length, _ = read_header(head)
+    return _make(code, file.read(length), lazy)
@@ -0,0 +1,227 @@
+from collections import namedtuple
+
+from . import parser, folding
+
+# types are named like the keys of ``CodeFragment.extra_registers``, None
+# means that nothing is known yet (no assignments seen)
+NUMBER = 'Number'
+STRING = 'String'
+ANY = '*'
+
+class IntRange(namedtuple('IntRange', 'lo hi')):
+    """Type ``int`` with known bounds of the value (inclusive)"""
+    __slots__ = ()
+
+INT32 = IntRange(-(1 << 31), (1 << 31) - 1)
+
+# after this number of passes growing ranges are widened to INT32
+WIDEN_AFTER = 3
+
+def fits(lo, hi):
+    """Returns IntRange if bounds are inside of int, else None"""
+    if INT32.lo <= lo and hi <= INT32.hi:
+        return IntRange(lo, hi)
+
+def is_numeric(typ):
+    return isinstance(typ, IntRange) or typ == NUMBER
+
+def join(a, b):
+    """Type of the variable which is assigned values of types ``a`` and
+    ``b``"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if isinstance(a, IntRange) and isinstance(b, IntRange):
+        return IntRange(min(a.lo, b.lo), max(a.hi, b.hi))
+    if is_numeric(a) and is_numeric(b):
+        return NUMBER
+    if a == b:
+        return a
+    return ANY
+
+def value_type(value):
+    if isinstance(value, bool):
+        return ANY
+    if isinstance(value, str):
+        return STRING
+    if isinstance(value, int) and fits(value, value):
+        return IntRange(value, value)
+    if isinstance(value, (int, float)):
+        return NUMBER
+    return ANY
+
+def _add(a, b):
+    if STRING in (a, b):
+        return STRING
+    if isinstance(a, IntRange) and isinstance(b, IntRange):
+        return fits(a.lo + b.lo, a.hi + b.hi) or NUMBER
+    if is_numeric(a) and is_numeric(b):
+        return NUMBER
+    return ANY
+
+def _subtract(a, b):
+    if isinstance(a, IntRange) and isinstance(b, IntRange):
+        return fits(a.lo - b.hi, a.hi - b.lo) or NUMBER
+    return NUMBER
+
+def _multiply(a, b):
+    # negative operand multiplied by zero gives negative zero which is
+    # not an int, so only non-negative ranges are ints
+    if isinstance(a, IntRange) and isinstance(b, IntRange) \
+        and a.lo >= 0 and b.lo >= 0:
+        return fits(a.lo * b.lo, a.hi * b.hi) or NUMBER
+    return NUMBER
+
+def _modulo(a, b):
+    if isinstance(a, IntRange) and isinstance(b, IntRange) \
+        and a.lo >= 0 and b.lo > 0:
+        return IntRange(0, min(a.hi, b.hi - 1))
+    return NUMBER
+
+def _bitand(a, b):
+    if isinstance(b, IntRange) and b.lo >= 0:
+        return IntRange(0, b.hi)
+    if isinstance(a, IntRange) and a.lo >= 0:
+        return IntRange(0, a.hi)
+    return INT32
+
+def _shr(a, b):
+    if not isinstance(a, IntRange):
+        a = INT32 # operand is converted to int
+    if isinstance(b, IntRange) and b.lo == b.hi:
+        return IntRange(a.lo >> (b.lo & 31), a.hi >> (b.lo & 31))
+    return IntRange(min(a.lo, 0), max(a.hi, 0))
+
+operators = {
+    parser.Add: _add,
+    parser.Subtract: _subtract,
+    parser.Multiply: _multiply,
+    parser.Divide: lambda a, b: NUMBER,
+    parser.Modulo: _modulo,
+    parser.BitAnd: _bitand,
+    parser.BitOr: lambda a, b: INT32,
+    parser.BitXor: lambda a, b: INT32,
+    parser.Shl: lambda a, b: INT32,
+    parser.Shr: _shr,
+    }
+
+# operators of augmented assignment
+AUGMENTED = {
+    '+=': parser.Add,
+    '-=': parser.Subtract,
+    '*=': parser.Multiply,
+    '/=': parser.Divide,
+    '%=': parser.Modulo,
+    }
+
+def binary_type(cls, a, b):
+    """Type of the result of the binary operator ``cls`` (node class)"""
+    if a is None or b is None:
+        return None
+    return operators[cls](a, b)
+
+def expr_type(node, env, lookup=folding._no_names):
+    """
+    Returns type of the expression ``node``. ``env`` is dict of types of
+    local variables, ``lookup`` is used for constants as in
+    ``folding.evaluate``
+    """
+    if isinstance(node, folding.FOLDABLE + (parser.Number, parser.String)) \
+        and not (isinstance(node, parser.Name) and node.value in env):
+        try:
+            return value_type(folding.evaluate(node, lookup))
+        except folding.NotConstant:
+            pass
+    if isinstance(node, parser.Name):
+        return env.get(node.value, ANY)
+    if isinstance(node, parser.Negate):
+        return NUMBER # negation of int zero is negative zero
+    if isinstance(node, parser.Ternary):
+        return join(expr_type(node.expr1, env, lookup),
+                    expr_type(node.expr2, env, lookup))
+    if type(node) in operators:
+        return binary_type(type(node), expr_type(node.left, env, lookup),
+                           expr_type(node.right, env, lookup))
+    return ANY
+
+def range_type(start, stop, step):
+    """Type of the loop variable of ``range`` loop, ``start`` and ``stop`` are
+    types of arguments (converted to int), ``step`` is literal step or None
+    if it's unknown"""
+    if start is None or stop is None:
+        return None
+    if not isinstance(start, IntRange):
+        start = INT32
+    if not isinstance(stop, IntRange):
+        stop = INT32
+    # counter may overflow after the last step and the loop continues
+    if step is None:
+        return INT32
+    elif step > 0:
+        if stop.hi - 1 + step > INT32.hi:
+            return INT32
+        return IntRange(start.lo, max(start.lo, stop.hi - 1))
+    else:
+        if stop.lo + 1 + step < INT32.lo:
+            return INT32
+        return IntRange(min(start.hi, stop.lo + 1), start.hi)
+
+def _binding_type(name, node, env, lookup, is_range):
+    if isinstance(node, parser.Assign) \
+        and isinstance(node.target, parser.Name):
+        if node.operator.value == '=':
+            return expr_type(node.expr, env, lookup)
+        cls = AUGMENTED.get(node.operator.value)
+        if cls is None:
+            return ANY
+        return binary_type(cls, env.get(name), expr_type(node.expr, env,
+            lookup))
+    if isinstance(node, parser.For) and len(node.var) == 1 \
+        and isinstance(node.var[0], parser.Name) and is_range(node):
+        args = node.expr.arguments
+        if len(args) < 2:
+            start, stop = IntRange(0, 0), expr_type(args[0], env, lookup)
+        else:
+            start = expr_type(args[0], env, lookup)
+            stop = expr_type(args[1], env, lookup)
+        if len(args) < 3:
+            step = 1
+        else:
+            try:
+                step = folding.evaluate(args[2], lookup)
+            except folding.NotConstant:
+                step = None
+            else:
+                if not isinstance(step, int) or not step:
+                    step = None
+        return range_type(start, stop, step)
+    return ANY
+
+def infer(body, names, lookup=folding._no_names, is_range=lambda node: False):
+    """
+    Infers types of local variables ``names`` assigned in the function
+    ``body``. Analysis doesn't depend on the order of statements: type of the
+    variable is a join of the types of all values assigned. ``is_range(node)``
+    checks if ``for`` loop iterates over ``range()``. Returns dict of types,
+    variables which can hold anything are omitted
+    """
+    bindings = folding.Bindings(body).nodes
+    names = sorted(name for name in names if name in bindings)
+    env = dict.fromkeys(names)
+    for i in range(100):
+        new = {}
+        for name in names:
+            typ = None
+            for node in bindings[name]:
+                typ = join(typ, _binding_type(name, node, env, lookup,
+                    is_range))
+            if i >= WIDEN_AFTER and isinstance(typ, IntRange) \
+                and typ != env[name]:
+                typ = join(typ, INT32)
+            new[name] = typ
+        if new == env:
+            break
+        env = new
+    return {name: typ for (name, typ) in env.items()
+        if typ is not None and typ != ANY}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Builds test and examples several times with different hash seeds and checks
+that output files are byte-for-byte the same
+"""
+import os.path
+import sys
+import subprocess
+import tempfile
+import optparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAYOUT = ['../lib/string.py', '../lib/layout/base.py',
+    '../lib/layout/primitives.py']
+# (directory, main class, output file, sources)
+TARGETS = [
+    ('test', 'Main', 'testpy.swf',
+        ['../lib/unittest.py', '../lib/string.py', 'testpy.py']),
+    ('examples', 'arkanoid.Main', 'arkanoid.swf',
+        LAYOUT + ['../lib/game.py', 'arkanoid/main.py']),
+    ('examples', 'pacman.Main', 'pacman.swf',
+        LAYOUT + ['../lib/game.py', 'pacman/main.py']),
+    ('examples', 'charts.Main', 'charts.swf',
+        LAYOUT + ['charts/data.py', 'charts/axes.py', 'charts/legend.py',
+            'charts/line.py', 'charts/main.py']),
+    ('examples', 'graph.Main', 'graph.swf',
+        ['../lib/string.py', 'graph/types.py', 'graph/colorshemes.py',
+            'graph/parser.py', 'graph/draw.py', 'graph/main.py']),
+    ('examples', 'layout.sample.Main', 'layout.swf',
+        LAYOUT + ['../lib/layout/sample.py']),
+    ('examples', 'debuginfo.Main', 'debuginfo.swf',
+        ['../lib/string.py', '../lib/logging.py', '../lib/console.py',
+            'debuginfo/main.py']),
+    ('examples', 'console.Main', 'console.swf',
+        ['../lib/string.py', '../lib/logging.py', '../lib/console.py',
+            'consolewrapper.py']),
+    ]
+
+def build(seed, library, outdir):
+    env = dict(os.environ,
+        PYTHONHASHSEED=str(seed),
+        PYTHONPATH=ROOT,
+        PYZZA_CACHE_DIR='', # cache must not hide unordered parsing
+        )
+    for (directory, main, output, sources) in TARGETS:
+        subprocess.check_call([sys.executable, '-m', 'pyzza.compile',
+            '-l', library, '-m', main, '-o', os.path.join(outdir, output)]
+            + sources, cwd=os.path.join(ROOT, directory), env=env)
+
+def main():
+    op = optparse.OptionParser(usage='%prog [options]')
+    op.add_option('-l', '--library', metavar='FILE',
+        help="Library to compile with",
+        dest="library", default='/opt/flex-sdk/frameworks/libs/player/10.0'
+            '/playerglobal.swc')
+    op.add_option('-s', '--seeds', metavar='LIST',
+        help="Comma-separated list of hash seeds (default %default)",
+        dest="seeds", default='0,1,7,123')
+    options, args = op.parse_args()
+    if args:
+        op.error("No arguments expected")
+    seeds = [int(s) for s in options.seeds.split(',')]
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in seeds:
+            os.mkdir(os.path.join(tmp, str(seed)))
+            build(seed, options.library, os.path.join(tmp, str(seed)))
+        for (directory, main, output, sources) in TARGETS:
+            with open(os.path.join(tmp, str(seeds[0]), output), 'rb') as f:
+                expected = f.read()
+            for seed in seeds[1:]:
+                with open(os.path.join(tmp, str(seed), output), 'rb') as f:
+                    if f.read() != expected:
+                        failed.append((output, seed))
+    for (output, seed) in failed:
+        print("{0} differs with PYTHONHASHSEED={1}".format(output, seed))
+    if failed:
+        sys.exit(1)
+    print("{0} files are the same for seeds {1}".format(len(TARGETS),
+        options.seeds))
+
+if __name__ == '__main__':
+    main()
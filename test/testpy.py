@@ -33,6 +33,19 @@ class Data(Test):
         self.assertEquals(0xFF0000, 16711680)
         self.assertEquals(0xFF0000 / 65536, 255) # 32bit, sorry
         self.assertEquals(0x870000 / 65536, 135)
+        big = 0xFF000000 # bigger than int, pushed as double
+        self.assertTrue(big > 0)
+        self.assertEquals(big, Math.pow(2, 32) - Math.pow(2, 24))
+        big = 0xFF000000 / 1 # folded
+        self.assertEquals(big, Math.pow(2, 32) - Math.pow(2, 24))
+        big = 3000000000.0
+        self.assertEquals(big, Math.pow(10, 9) * 3)
+        big = 0x7FFFFFFF + 1
+        self.assertEquals(big, Math.pow(2, 31))
+        big = 0x7FFFFFFF
+        self.assertEquals(big, Math.pow(2, 31) - 1)
+        big = -0x80000000
+        self.assertEquals(big, -Math.pow(2, 31))
 
     def testMakeList(self):
         a = [1, 2]
@@ -130,6 +143,10 @@ class TestMath(Test):
         self.assertTrue(3 >= 2)
         self.assertTrue(2 >= 2)
         self.assertFalse(1 >= 2)
+        self.assertFalse((1 < 2) == 1) # compared strictly
+        self.assertTrue(1 / (0 * -1) < 0) # negative zero
+        self.assertTrue(1 / (-3 * 0) < 0)
+        self.assertTrue((1 < 2) != 1)
 
     def _reset(self):
         self.history = []